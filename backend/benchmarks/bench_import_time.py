@@ -0,0 +1,84 @@
+"""Measure cold-start import time of the API with ``python -X importtime``.
+
+Imports ``api/index.py``'s target (backend.main) in a fresh interpreter, prints
+the slowest modules and exits non-zero if the total goes over the budget or
+if an SDK that should load lazily was imported at startup.
+
+    python -m backend.benchmarks.bench_import_time [--budget-ms 800] [--runs 5]
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Must only be imported by the first request that needs them
+LAZY_MODULES = (
+    "google.generativeai",
+    "firebase_admin",
+    "google.cloud.firestore",
+    "googleapiclient.discovery",
+    "grpc",
+)
+
+LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(target: str):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        raise SystemExit(f"importing {target} failed")
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, _, name = match.groups()
+            modules[name] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", default="backend.main")
+    parser.add_argument("--budget-ms", type=float, default=800.0, help="fail when the median cumulative import time is above this")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    runs = [measure(args.target) for _ in range(args.runs)]
+    totals = [modules[args.target][1] / 1000 for modules in runs]
+    median = statistics.median(totals)
+
+    last = runs[-1]
+    print(f"{args.target}: median {median:.1f} ms over {args.runs} runs (min {min(totals):.1f}, max {max(totals):.1f})")
+    print(f"\n{'cumulative ms':>14} {'self ms':>9}  module")
+    for name, (self_us, cumulative_us) in sorted(last.items(), key=lambda kv: kv[1][0], reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+
+    failures = []
+    eager = sorted(name for name in last if any(name == m or name.startswith(m + ".") for m in LAZY_MODULES))
+    if eager:
+        failures.append("imported at startup but should be lazy: " + ", ".join(eager))
+    if median > args.budget_ms:
+        failures.append(f"median import time {median:.1f} ms is over the {args.budget_ms:.0f} ms budget")
+
+    if failures:
+        print("\nFAIL")
+        for failure in failures:
+            print(f"  - {failure}")
+        raise SystemExit(1)
+    print("\nOK")
+
+
+if __name__ == "__main__":
+    main()
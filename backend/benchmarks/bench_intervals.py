@@ -0,0 +1,92 @@
+"""Benchmark conflict detection and free-slot search.
+
+Compares the interval index against naive pairwise checks for growing numbers
+of busy blocks and activity occurrences, with and without one busy block
+spanning the whole window (an out-of-office or an all-term event).
+
+    python -m backend.benchmarks.bench_intervals [--sizes 100,1000,10000]
+"""
+import argparse
+import random
+import time as timer
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+from backend.intervals import find_conflicts, free_slots, merge_intervals
+
+TZ = ZoneInfo("America/Sao_Paulo")
+WINDOW_START = datetime(2026, 2, 2, tzinfo=TZ)
+WINDOW_DAYS = 120
+
+
+def _random_intervals(n, seed, label):
+    rng = random.Random(seed)
+    lo = WINDOW_START.timestamp()
+    span = WINDOW_DAYS * 86400
+    intervals = []
+    for i in range(n):
+        start = lo + rng.random() * span
+        intervals.append((start, start + rng.choice([30, 45, 60, 90, 120]) * 60, {label: i}))
+    return intervals
+
+
+def naive_conflicts(activities, busy):
+    conflicts = []
+    for activity in activities:
+        for block in busy:
+            if activity[0] < block[1] and block[0] < activity[1]:
+                conflicts.append((activity, block))
+    for i, a in enumerate(activities):
+        for b in activities[i + 1:]:
+            if a[0] < b[1] and b[0] < a[1]:
+                conflicts.append((a, b))
+    return conflicts
+
+
+def _timed(fn, *args, **kwargs):
+    started = timer.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (timer.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="100,1000,5000,10000")
+    parser.add_argument("--naive-max", type=int, default=5000, help="skip the O(n^2) baseline above this size")
+    args = parser.parse_args()
+
+    window_end = WINDOW_START + timedelta(days=WINDOW_DAYS)
+    print(f"{'events':>8} {'conflicts':>10} {'index ms':>10} {'naive ms':>10} {'slots ms':>10} {'+long ms':>10}")
+
+    for n in [int(s) for s in args.sizes.split(",")]:
+        busy = _random_intervals(n, seed=n, label="busy")
+        activities = _random_intervals(n // 4, seed=n + 1, label="activity")
+
+        conflicts, index_ms = _timed(find_conflicts, activities, busy)
+
+        naive_ms = float("nan")
+        if n <= args.naive_max:
+            expected, naive_ms = _timed(naive_conflicts, activities, busy)
+            assert len(expected) == len(conflicts), (len(expected), len(conflicts))
+
+        _, slots_ms = _timed(
+            free_slots,
+            merge_intervals(busy + activities),
+            WINDOW_START,
+            window_end,
+            timedelta(minutes=60),
+            TZ,
+            time(8, 0),
+            time(22, 0),
+            limit=5,
+        )
+
+        long_block = (WINDOW_START.timestamp(), window_end.timestamp(), {"busy": "long"})
+        with_long, long_ms = _timed(find_conflicts, activities, busy + [long_block])
+        assert len(with_long) == len(conflicts) + len(activities), (len(with_long), len(conflicts))
+
+        print(f"{n:>8} {len(conflicts):>10} {index_ms:>10.1f} {naive_ms:>10.1f} {slots_ms:>10.1f} {long_ms:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
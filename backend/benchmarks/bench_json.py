@@ -0,0 +1,93 @@
+"""Benchmark response serialization and compression.
+
+Compares FastAPI's default path (jsonable_encoder + json.dumps) with
+FastJSONResponse on notes/kanban-shaped payloads carrying Firestore-style
+timestamps, and reports the bytes saved by gzip and brotli.
+
+    python -m backend.benchmarks.bench_json [--docs 50,500,2000] [--repeat 20]
+"""
+import argparse
+import gzip
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from fastapi.encoders import jsonable_encoder
+
+from backend.compression import BROTLI_QUALITY, GZIP_LEVEL, brotli
+from backend.responses import dumps
+
+
+class DatetimeWithNanoseconds(datetime):
+    """Stand-in for google.api_core.datetime_helpers.DatetimeWithNanoseconds."""
+
+
+def make_docs(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    base = DatetimeWithNanoseconds(2026, 1, 1, tzinfo=timezone.utc)
+    words = "estudar revisar prova cálculo física história resumo exercício leitura projeto".split()
+    docs = []
+    for i in range(n):
+        created = base + timedelta(minutes=rng.randint(0, 500000))
+        docs.append({
+            "id": f"doc{i}",
+            "title": " ".join(rng.choices(words, k=4)),
+            "content": " ".join(rng.choices(words, k=300)),
+            "createdAt": DatetimeWithNanoseconds.fromtimestamp(created.timestamp(), timezone.utc),
+            "updatedAt": DatetimeWithNanoseconds.fromtimestamp(created.timestamp() + 3600, timezone.utc),
+            "tags": rng.sample(words, 3),
+            "tasks": [
+                {"id": f"t{i}-{j}", "title": " ".join(rng.choices(words, k=3)), "column": rng.choice(["todo", "in-progress", "done"])}
+                for j in range(5)
+            ],
+        })
+    return docs
+
+
+def default_path(content) -> bytes:
+    # What JSONResponse does after FastAPI's serialize_response
+    return json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def cpu_ms(fn, content, repeat: int) -> float:
+    started = time.process_time()
+    for _ in range(repeat):
+        fn(content)
+    return (time.process_time() - started) * 1000 / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", default="50,500,2000")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'docs':>6} {'default ms':>11} {'fast ms':>9} {'speedup':>8} {'raw KB':>9} {'gzip KB':>9} {'br KB':>9} {'gzip ms':>8} {'br ms':>8}")
+    for n in [int(d) for d in args.docs.split(",")]:
+        docs = make_docs(n)
+        default_ms = cpu_ms(default_path, docs, args.repeat)
+        fast_ms = cpu_ms(dumps, docs, args.repeat)
+
+        body = dumps(docs)
+        assert json.loads(body) == json.loads(default_path(docs))
+
+        started = time.process_time()
+        gzipped = gzip.compress(body, compresslevel=GZIP_LEVEL)
+        gzip_ms = (time.process_time() - started) * 1000
+        br_size = br_ms = float("nan")
+        if brotli is not None:
+            started = time.process_time()
+            br_size = len(brotli.compress(body, quality=BROTLI_QUALITY)) / 1024
+            br_ms = (time.process_time() - started) * 1000
+
+        print(
+            f"{n:>6} {default_ms:>11.2f} {fast_ms:>9.2f} {default_ms / fast_ms:>7.1f}x "
+            f"{len(body) / 1024:>9.1f} {len(gzipped) / 1024:>9.1f} {br_size:>9.1f} {gzip_ms:>8.2f} {br_ms:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""Hermetic load and latency benchmark for the API.
+
+Runs every router against the local fakes in ``backend.benchmarks.fakes``,
+either in-process (httpx ASGI transport) or over a real uvicorn socket, for a
+sweep of concurrency levels. Prints throughput and p50/p95/p99 per scenario
+and writes the results as JSON so runs can be compared between commits.
+
+    python -m backend.benchmarks.bench_load --mode inprocess --concurrency 1,8,32
+    python -m backend.benchmarks.bench_load --mode uvicorn --latency gemini=800,google=120
+    python -m backend.benchmarks.bench_load --out new.json --baseline old.json
+
+Needs httpx (and uvicorn for --mode uvicorn); the Google/Firebase/Gemini SDKs
+are not needed.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from backend.benchmarks import fakes
+
+ACCESS_TOKEN = "bench-access-token"
+
+
+def _events_batch(n: int) -> Dict[str, Any]:
+    return {"events": [
+        {
+            "summary": f"Aula {i}",
+            "start_time": f"2026-03-{1 + i % 28:02d}T08:00:00",
+            "end_time": f"2026-03-{1 + i % 28:02d}T10:00:00",
+            "access_token": ACCESS_TOKEN,
+        }
+        for i in range(n)
+    ]}
+
+
+# (router, name, method, path, body factory)
+SCENARIOS: List[tuple] = [
+    ("auth", "verify", "GET", "/api/auth/api/auth/verify", None),
+    ("data", "get_notes", "GET", "/api/data/notes", None),
+    ("data", "save_note", "POST", "/api/data/notes", lambda: {"title": "Nota", "content": "x" * 2000}),
+    ("calendar", "list_events", "POST", "/api/calendar/list_events", lambda: {"access_token": ACCESS_TOKEN}),
+    ("calendar", "create_events_batch", "POST", "/api/calendar/create_events_batch", lambda: _events_batch(120)),
+    ("calendar", "availability", "POST", "/api/calendar/availability", lambda: {
+        "access_token": ACCESS_TOKEN,
+        "timeMin": "2026-03-01T00:00:00-03:00",
+        "timeMax": "2026-03-31T00:00:00-03:00",
+        "activities": [{"title": "Estudo", "day_of_week": d, "start_time": "09:00", "end_time": "11:00"} for d in range(1, 6)],
+    }),
+    ("tasks", "list_tasks", "POST", "/api/tasks/list_tasks", lambda: {"access_token": ACCESS_TOKEN, "all_lists": True}),
+    ("tasks", "bulk", "POST", "/api/tasks/bulk", lambda: {
+        "access_token": ACCESS_TOKEN,
+        "operations": [{"op": "create", "title": f"Meta {i}"} for i in range(60)],
+    }),
+    ("gemini", "chat", "POST", "/api/gemini/", lambda: {"message": "Oi", "conversationHistory": [], "context": {"tasks": []}}),
+    # Server-side history: the request stays the same size however long the conversation gets
+    ("gemini", "chat_stored", "POST", "/api/gemini/", lambda: {"message": "Oi", "conversationId": "bench-conversation", "context": {"tasks": []}}),
+    ("sync", "sync_tasks", "POST", "/api/sync/tasks", lambda: {"access_token": ACCESS_TOKEN}),
+    ("search", "search", "GET", "/api/search/?q=revisao%20fisica", None),
+    ("conversations", "list", "GET", "/api/conversations/", None),
+    ("conversations", "turns", "GET", "/api/conversations/bench-history/turns?limit=20", None),
+    ("jobs", "enqueue_events", "POST", "/api/calendar/create_events_batch/jobs", lambda: _events_batch(20)),
+    ("jobs", "list", "GET", "/api/jobs/", None),
+]
+
+
+# Endpoints mounted at "/" of different routers, which must not share a metrics label
+ROUTE_LABEL_CHECKS = ["/", "/api/search/?q=prova", "/api/jobs/", "/api/conversations/"]
+
+
+async def check_route_labels(client) -> None:
+    for path in ROUTE_LABEL_CHECKS:
+        await client.get(path, headers={"Authorization": "Bearer bench-token"})
+    exposition = (await client.get("/api/metrics")).text
+    for path in ROUTE_LABEL_CHECKS:
+        label = path.split("?")[0]
+        if f'route="{label}"' not in exposition:
+            raise SystemExit(f"Route label check failed: no http_requests_total series for {label}")
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+async def run_scenario(client, scenario, concurrency: int, requests: int) -> Dict[str, Any]:
+    router, name, method, path, body = scenario
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in counter:
+            started = time.perf_counter()
+            response = await client.request(
+                method,
+                path,
+                json=body() if body else None,
+                headers={"Authorization": "Bearer bench-token"},
+            )
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    wall = time.perf_counter() - started
+
+    return {
+        "router": router,
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": round(requests / wall, 2),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "mean_ms": round(statistics.fmean(latencies), 2),
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.asynccontextmanager
+async def make_client(app, mode: str):
+    import httpx
+
+    if mode == "inprocess":
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            yield client
+        return
+
+    import uvicorn
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        await asyncio.sleep(0.01)
+    try:
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=120, limits=limits) as client:
+            yield client
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+
+async def run(args) -> List[Dict[str, Any]]:
+    from backend.main import app
+
+    selected = [s for s in SCENARIOS if not args.routers or s[0] in args.routers]
+    results = []
+    async with make_client(app, args.mode) as client:
+        await check_route_labels(client)
+        for scenario in selected:
+            # Warm-up: lazy imports, discovery build, caches
+            await run_scenario(client, scenario, 1, 2)
+            for concurrency in args.concurrency:
+                fakes.seed()
+                results.append(await run_scenario(client, scenario, concurrency, max(args.requests, concurrency)))
+    return results
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def _parse_latency(value: str) -> Dict[str, float]:
+    latency = {}
+    for item in filter(None, value.split(",")):
+        upstream, ms = item.split("=")
+        latency[upstream.strip()] = float(ms)
+    return latency
+
+
+def _print_table(results: List[Dict[str, Any]], baseline: Optional[Dict[tuple, Dict[str, Any]]]) -> None:
+    header = f"{'router':<13} {'scenario':<20} {'conc':>5} {'rps':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'err':>5}"
+    if baseline:
+        header += f" {'p95 vs base':>12}"
+    print(header)
+    for r in results:
+        line = (
+            f"{r['router']:<13} {r['scenario']:<20} {r['concurrency']:>5} {r['throughput_rps']:>9.1f} "
+            f"{r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['errors']:>5}"
+        )
+        if baseline:
+            base = baseline.get((r["router"], r["scenario"], r["concurrency"]))
+            if base and base["p95_ms"]:
+                line += f" {(r['p95_ms'] / base['p95_ms'] - 1) * 100:>+11.1f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=["inprocess", "uvicorn"], default="inprocess")
+    parser.add_argument("--concurrency", default="1,8,32", type=lambda v: [int(c) for c in v.split(",")])
+    parser.add_argument("--requests", type=int, default=100, help="requests per scenario and concurrency level")
+    parser.add_argument("--routers", default="", type=lambda v: [r for r in v.split(",") if r], help="comma separated subset, e.g. data,tasks")
+    parser.add_argument("--latency", default="", type=_parse_latency, help="upstream=ms pairs for auth, firestore, google, gemini")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--baseline", help="previous --out file to compare p95 against")
+    args = parser.parse_args()
+
+    os.environ.setdefault("GEMINI_API_KEY", "bench")
+    # Jobs go to a throwaway SQLite file, not the one a dev server uses
+    os.environ.setdefault("JOBS_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="bench-jobs-"), "jobs.sqlite3"))
+    fakes.install(args.latency, args.jitter)
+    fakes.seed()
+
+    # The app logs one line per request; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = asyncio.run(run(args))
+
+    report = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": sys.version.split()[0],
+        "mode": args.mode,
+        "latency_ms": fakes._latency.latency_ms,
+        "jitter": args.jitter,
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {(r["router"], r["scenario"], r["concurrency"]): r for r in json.load(f)["results"]}
+
+    _print_table(results, baseline)
+    print(f"\nResults written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
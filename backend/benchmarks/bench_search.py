@@ -0,0 +1,73 @@
+"""Benchmark the full-text search index.
+
+Builds an index over a synthetic Portuguese corpus of growing size and
+reports build time, the cost of re-saving the notes blob with one edited note,
+and query latency, next to the substring scan the browser used to do.
+
+    python -m backend.benchmarks.bench_search [--sizes 1000,10000] [--queries 200]
+"""
+import argparse
+import random
+import statistics
+import time
+
+from backend.search import SearchIndex, extract, fold
+
+WORDS = (
+    "revisão prova cálculo física química biologia história geografia redação "
+    "matemática exercícios capítulo resumo lições equação função derivada integral "
+    "célula genética revolução guerra clima energia vetores óptica leitura projeto "
+    "estudar estudo apresentação seminário trabalho entrega semana manhã tarde noite"
+).split()
+QUERIES = ["revisao", "calculo integral", "licao", "estud", "quimica organica", "prova de fisica", "genet", "redação enem"]
+
+
+def _corpus(n: int, seed: int = 1):
+    rng = random.Random(seed)
+    notes = []
+    for i in range(n):
+        title = " ".join(rng.choice(WORDS) for _ in range(3)).capitalize()
+        content = " ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 200)))
+        notes.append({"id": f"n{i}", "title": title, "content": content})
+    return notes
+
+
+def naive_search(notes, query):
+    needle = fold(query)
+    return [n for n in notes if needle in fold(n["title"]) or needle in fold(n["content"])]
+
+
+def _ms(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,5000,20000")
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'notes':>7} {'build ms':>9} {'update ms':>10} {'p50 ms':>8} {'p95 ms':>8} {'naive p50':>10}")
+    for n in [int(s) for s in args.sizes.split(",")]:
+        notes = _corpus(n)
+        index = SearchIndex()
+        _, build_ms = _ms(index.replace_source, "notes", "data", extract("notes", "data", {"notes": notes}))
+
+        notes[n // 2] = {**notes[n // 2], "content": notes[n // 2]["content"] + " apostila nova"}
+        _, update_ms = _ms(index.replace_source, "notes", "data", extract("notes", "data", {"notes": notes}))
+
+        latencies, naive = [], []
+        for i in range(args.queries):
+            query = QUERIES[i % len(QUERIES)]
+            latencies.append(_ms(index.search, query, 10)[1])
+            if i < len(QUERIES):
+                naive.append(_ms(naive_search, notes, query)[1])
+
+        p95 = statistics.quantiles(latencies, n=20)[-1]
+        print(f"{n:>7} {build_ms:>9.1f} {update_ms:>10.1f} {statistics.median(latencies):>8.2f} {p95:>8.2f} {statistics.median(naive):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
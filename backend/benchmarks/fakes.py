@@ -0,0 +1,519 @@
+"""Local stand-ins for every upstream the backend talks to.
+
+``install()`` registers fake ``firebase_admin``, ``google.generativeai``,
+``googleapiclient.discovery`` and ``google.oauth2.credentials`` modules in
+``sys.modules`` before the app is imported, so the benchmarks never touch the
+network and do not need the real SDKs. Each fake call sleeps for the latency
+configured for its upstream to mimic a real round trip.
+"""
+import itertools
+import random
+import sys
+import threading
+import time
+import types
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_LATENCY_MS = {
+    "auth": 2.0,
+    "firestore": 15.0,
+    "google": 60.0,
+    "gemini": 400.0,
+}
+
+
+class Latency:
+    def __init__(self, latency_ms: Dict[str, float], jitter: float = 0.2, seed: int = 0):
+        self.latency_ms = {**DEFAULT_LATENCY_MS, **latency_ms}
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def wait(self, upstream: str) -> None:
+        base = self.latency_ms.get(upstream, 0.0) / 1000
+        if base <= 0:
+            return
+        with self.lock:
+            factor = 1 + self.rng.uniform(-self.jitter, self.jitter)
+        time.sleep(base * factor)
+
+
+_latency = Latency({})
+
+
+# Firestore
+
+class _Store:
+    def __init__(self):
+        self.collections: Dict[Tuple[str, ...], Dict[str, Dict[str, Any]]] = {}
+        self.lock = threading.Lock()
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id: str, data: Optional[Dict[str, Any]], reference=None):
+        self.id = doc_id
+        self._data = data
+        self.exists = data is not None
+        self.reference = reference
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocumentRef:
+    def __init__(self, store: _Store, parent: Tuple[str, ...], doc_id: str):
+        self._store = store
+        self._parent = parent
+        self.id = doc_id
+
+    def collection(self, name: str) -> "FakeCollectionRef":
+        return FakeCollectionRef(self._store, self._parent + (self.id, name))
+
+    def _write(self, data, merge=False):
+        with self._store.lock:
+            docs = self._store.collections.setdefault(self._parent, {})
+            if merge and self.id in docs:
+                docs[self.id] = {**docs[self.id], **data}
+            else:
+                docs[self.id] = dict(data)
+
+    def _delete(self):
+        with self._store.lock:
+            self._store.collections.get(self._parent, {}).pop(self.id, None)
+
+    def _read(self) -> FakeSnapshot:
+        with self._store.lock:
+            data = self._store.collections.get(self._parent, {}).get(self.id)
+        return FakeSnapshot(self.id, data, self)
+
+    def _create(self, data):
+        with self._store.lock:
+            docs = self._store.collections.setdefault(self._parent, {})
+            if self.id in docs:
+                raise FakeConflict(f"Document already exists: {self.id}")
+            docs[self.id] = dict(data)
+
+    def set(self, data, merge=False):
+        _latency.wait("firestore")
+        self._write(data, merge)
+
+    def update(self, data):
+        _latency.wait("firestore")
+        self._write(data, merge=True)
+
+    def delete(self):
+        _latency.wait("firestore")
+        self._delete()
+
+    def get(self, transaction=None):
+        _latency.wait("firestore")
+        return self._read()
+
+
+_OPS = {
+    "==": lambda a, b: a == b,
+    ">": lambda a, b: a is not None and a > b,
+    ">=": lambda a, b: a is not None and a >= b,
+    "<": lambda a, b: a is not None and a < b,
+    "in": lambda a, b: a in b,
+}
+
+
+class FakeConflict(Exception):
+    code = 409
+
+
+class FakeCollectionRef:
+    def __init__(self, store: _Store, path: Tuple[str, ...], filters=(), order=None, limit_to=None):
+        self._store = store
+        self._path = path
+        self._filters = filters
+        self._order = order
+        self._limit = limit_to
+
+    def _copy(self, **changes) -> "FakeCollectionRef":
+        state = {"filters": self._filters, "order": self._order, "limit_to": self._limit, **changes}
+        return FakeCollectionRef(self._store, self._path, **state)
+
+    def document(self, doc_id: Optional[str] = None) -> FakeDocumentRef:
+        return FakeDocumentRef(self._store, self._path, doc_id or uuid.uuid4().hex[:20])
+
+    def where(self, field, op, value) -> "FakeCollectionRef":
+        return self._copy(filters=self._filters + ((field, op, value),))
+
+    def order_by(self, field, direction="ASCENDING") -> "FakeCollectionRef":
+        return self._copy(order=(field, direction == "DESCENDING"))
+
+    def limit(self, count: int) -> "FakeCollectionRef":
+        return self._copy(limit_to=count)
+
+    def stream(self):
+        _latency.wait("firestore")
+        with self._store.lock:
+            docs = list(self._store.collections.get(self._path, {}).items())
+        docs = [(doc_id, data) for doc_id, data in docs if all(_OPS[op](data.get(field), value) for field, op, value in self._filters)]
+        if self._order:
+            field, descending = self._order
+            docs = sorted((d for d in docs if d[1].get(field) is not None), key=lambda d: d[1][field], reverse=descending)
+        for doc_id, data in docs[:self._limit]:
+            yield FakeSnapshot(doc_id, data, FakeDocumentRef(self._store, self._path, doc_id))
+
+
+class FakeWriteBatch:
+    def __init__(self):
+        self._ops = []
+
+    def set(self, ref, data, merge=False):
+        self._ops.append(lambda: ref._write(data, merge))
+
+    def delete(self, ref):
+        self._ops.append(ref._delete)
+
+    def commit(self):
+        _latency.wait("firestore")
+        for op in self._ops:
+            op()
+
+
+class FakeFirestoreClient:
+    def __init__(self, store: _Store):
+        self._store = store
+
+    def collection(self, name: str) -> FakeCollectionRef:
+        return FakeCollectionRef(self._store, (name,))
+
+    def get_all(self, refs):
+        _latency.wait("firestore")
+        return [ref._read() for ref in refs]
+
+    def batch(self):
+        return FakeWriteBatch()
+
+    def transaction(self):
+        return FakeTransaction()
+
+
+class FakeTransaction(FakeWriteBatch):
+    def create(self, ref, data):
+        self._ops.append(lambda: ref._create(data))
+
+    def update(self, ref, data):
+        self._ops.append(lambda: ref._write(data, merge=True))
+
+
+_transaction_lock = threading.Lock()
+
+
+def _transactional(fn):
+    # Transactions run one at a time: serializable, like Firestore's retry on contention
+    def run(transaction, *args, **kwargs):
+        with _transaction_lock:
+            result = fn(transaction, *args, **kwargs)
+            transaction.commit()
+        return result
+    return run
+
+
+# Google Calendar / Tasks discovery clients
+
+class FakeHttpError(Exception):
+    def __init__(self, status: int, message: str = ""):
+        super().__init__(message or f"HTTP {status}")
+        self.resp = types.SimpleNamespace(status=status)
+        self.error_details = []
+
+
+class _GoogleStore:
+    def __init__(self):
+        self.events: Dict[str, Dict[str, Any]] = {}
+        self.tasklists: Dict[str, Dict[str, Any]] = {}
+        self.tasks: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def next_id(self) -> str:
+        with self.lock:
+            return f"id{next(self.ids)}"
+
+
+def _now_rfc3339() -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())
+
+
+class FakeRequest:
+    def __init__(self, fn):
+        self._fn = fn
+
+    def _run(self):
+        return self._fn()
+
+    def execute(self):
+        _latency.wait("google")
+        return self._fn()
+
+
+class _Events:
+    def __init__(self, store: _GoogleStore):
+        self.store = store
+
+    def insert(self, calendarId, body):
+        def run():
+            if body.get("id") in self.store.events:
+                raise FakeHttpError(409)
+            event = {**body, "id": body.get("id") or self.store.next_id(), "htmlLink": "https://calendar.example/event"}
+            self.store.events[event["id"]] = event
+            return event
+        return FakeRequest(run)
+
+    def patch(self, calendarId, eventId, body):
+        def run():
+            if eventId not in self.store.events:
+                raise FakeHttpError(404)
+            self.store.events[eventId].update(body)
+            return self.store.events[eventId]
+        return FakeRequest(run)
+
+    def delete(self, calendarId, eventId):
+        def run():
+            if self.store.events.pop(eventId, None) is None:
+                raise FakeHttpError(410)
+            return ""
+        return FakeRequest(run)
+
+    def list(self, calendarId, **params):
+        return FakeRequest(lambda: {"items": list(self.store.events.values())})
+
+
+class _FreeBusy:
+    def __init__(self, store: _GoogleStore):
+        self.store = store
+
+    def query(self, body):
+        def run():
+            busy = [{"start": e["start"]["dateTime"], "end": e["end"]["dateTime"]} for e in self.store.events.values()]
+            return {"calendars": {item["id"]: {"busy": busy} for item in body.get("items", [])}}
+        return FakeRequest(run)
+
+
+class _Tasks:
+    def __init__(self, store: _GoogleStore):
+        self.store = store
+
+    def _list(self, tasklist):
+        return self.store.tasks.setdefault(tasklist, {})
+
+    def insert(self, tasklist, body):
+        def run():
+            task = {**body, "id": self.store.next_id(), "updated": _now_rfc3339(), "position": f"{len(self._list(tasklist)):020d}"}
+            self._list(tasklist)[task["id"]] = task
+            return task
+        return FakeRequest(run)
+
+    def patch(self, tasklist, task, body):
+        def run():
+            if task not in self._list(tasklist):
+                raise FakeHttpError(404)
+            self._list(tasklist)[task].update(body, updated=_now_rfc3339())
+            return self._list(tasklist)[task]
+        return FakeRequest(run)
+
+    def delete(self, tasklist, task):
+        def run():
+            if self._list(tasklist).pop(task, None) is None:
+                raise FakeHttpError(404)
+            return ""
+        return FakeRequest(run)
+
+    def list(self, tasklist, maxResults=100, pageToken=None, updatedMin=None, **params):
+        def run():
+            items = list(self._list(tasklist).values())
+            if updatedMin:
+                items = [t for t in items if t["updated"] >= updatedMin]
+            start = int(pageToken or 0)
+            page = {"items": items[start:start + maxResults]}
+            if start + maxResults < len(items):
+                page["nextPageToken"] = str(start + maxResults)
+            return page
+        return FakeRequest(run)
+
+
+class _TaskLists:
+    def __init__(self, store: _GoogleStore):
+        self.store = store
+
+    def list(self, maxResults=100, pageToken=None):
+        return FakeRequest(lambda: {"items": list(self.store.tasklists.values())})
+
+
+class FakeBatch:
+    def __init__(self, callback):
+        self._callback = callback
+        self._requests: List[Tuple[str, FakeRequest]] = []
+
+    def add(self, request, request_id=None, callback=None):
+        self._requests.append((request_id or str(len(self._requests)), request))
+
+    def execute(self):
+        # One round trip for the whole batch
+        _latency.wait("google")
+        for request_id, request in self._requests:
+            try:
+                response = request._run()
+            except FakeHttpError as e:
+                self._callback(request_id, None, e)
+            else:
+                self._callback(request_id, response, None)
+
+
+class FakeService:
+    def __init__(self, store: _GoogleStore):
+        self._store = store
+
+    def events(self):
+        return _Events(self._store)
+
+    def freebusy(self):
+        return _FreeBusy(self._store)
+
+    def tasks(self):
+        return _Tasks(self._store)
+
+    def tasklists(self):
+        return _TaskLists(self._store)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(callback)
+
+
+# Gemini
+
+class FakeChatSession:
+    def send_message(self, parts):
+        _latency.wait("gemini")
+        text = parts[0]["text"] if parts else ""
+        part = types.SimpleNamespace(text=f"Resposta para: {text}", function_call=None)
+        return types.SimpleNamespace(parts=[part])
+
+
+class FakeGenerativeModel:
+    def __init__(self, model_name=None, system_instruction=None, tools=None):
+        self.model_name = model_name
+
+    def start_chat(self, history=None):
+        return FakeChatSession()
+
+
+# Installation
+
+firestore_store = _Store()
+google_store = _GoogleStore()
+
+
+def _module(name: str, **attrs) -> types.ModuleType:
+    module = types.ModuleType(name)
+    module.__path__ = []
+    module.__dict__.update(attrs)
+    sys.modules[name] = module
+    return module
+
+
+def _ensure_package(name: str) -> types.ModuleType:
+    try:
+        __import__(name)
+        return sys.modules[name]
+    except ImportError:
+        return _module(name)
+
+
+def seed(events: int = 200, tasks: int = 250, tasklists: int = 3, notes: int = 50, schedules: int = 20, turns: int = 40, uid: str = "bench-user") -> None:
+    google_store.events.clear()
+    google_store.tasks.clear()
+    google_store.tasklists.clear()
+    for i in range(events):
+        day = 1 + i % 28
+        event_id = google_store.next_id()
+        google_store.events[event_id] = {
+            "id": event_id,
+            "summary": f"Evento {i}",
+            "start": {"dateTime": f"2026-03-{day:02d}T{8 + i % 10:02d}:00:00-03:00"},
+            "end": {"dateTime": f"2026-03-{day:02d}T{9 + i % 10:02d}:00:00-03:00"},
+        }
+    for i in range(tasklists):
+        list_id = "@default" if i == 0 else f"list{i}"
+        google_store.tasklists[list_id] = {"id": list_id, "title": f"Lista {i}"}
+        for j in range(tasks // tasklists):
+            task_id = google_store.next_id()
+            google_store.tasks.setdefault(list_id, {})[task_id] = {
+                "id": task_id,
+                "title": f"Tarefa {j}",
+                "status": "needsAction",
+                "updated": "2026-01-01T00:00:00.000Z",
+                "position": f"{j:020d}",
+            }
+    notes_docs = firestore_store.collections.setdefault(("users", uid, "notes"), {})
+    notes_docs.clear()
+    for i in range(notes):
+        notes_docs[f"note{i}"] = {"id": f"note{i}", "title": f"Nota {i}", "content": "Lorem ipsum dolor sit amet. " * 40}
+
+    # Searchable documents: one per schedule, as the client stores them
+    schedule_docs = firestore_store.collections.setdefault(("users", uid, "schedules"), {})
+    schedule_docs.clear()
+    subjects = ["Cálculo", "Física", "Química", "História", "Redação"]
+    for i in range(schedules):
+        schedule_docs[f"schedule{i}"] = {
+            "id": f"schedule{i}",
+            "title": f"Cronograma {i}",
+            "activities": [
+                {"title": f"Revisão de {subject}", "description": f"Exercícios e resumo de {subject.lower()}"}
+                for subject in subjects
+            ],
+        }
+
+    # A stored conversation with some history
+    conversation = ("users", uid, "conversations")
+    firestore_store.collections.setdefault(conversation, {})["bench-history"] = {
+        "title": "Histórico", "last_seq": turns, "created_at": "2026-01-01T00:00:00+00:00", "updated_at": "2026-01-01T00:00:00+00:00",
+    }
+    turn_docs = firestore_store.collections.setdefault(conversation + ("bench-history", "turns"), {})
+    turn_docs.clear()
+    for seq in range(1, turns + 1):
+        turn_docs[f"{seq:08d}"] = {"seq": seq, "role": "user" if seq % 2 else "assistant", "content": f"Mensagem {seq}", "created_at": "2026-01-01T00:00:00+00:00"}
+
+
+def install(latency_ms: Optional[Dict[str, float]] = None, jitter: float = 0.2, uid: str = "bench-user") -> None:
+    """Register the fakes in sys.modules. Call before importing backend.main."""
+    global _latency
+    _latency = Latency(latency_ms or {}, jitter)
+
+    def verify_id_token(token, clock_skew_seconds=0):
+        _latency.wait("auth")
+        return {"uid": uid, "email": f"{uid}@example.com"}
+
+    firestore_client = FakeFirestoreClient(firestore_store)
+    firebase_admin = _module("firebase_admin", _apps={"[DEFAULT]": object()}, initialize_app=lambda *a, **k: None)
+    firebase_admin.auth = _module("firebase_admin.auth", verify_id_token=verify_id_token)
+    firebase_admin.firestore = _module(
+        "firebase_admin.firestore",
+        client=lambda: firestore_client,
+        transactional=_transactional,
+        Query=types.SimpleNamespace(ASCENDING="ASCENDING", DESCENDING="DESCENDING"),
+    )
+    firebase_admin.credentials = _module("firebase_admin.credentials", Certificate=lambda path: path)
+
+    google = _ensure_package("google")
+    google.generativeai = _module("google.generativeai", configure=lambda **k: None, GenerativeModel=FakeGenerativeModel)
+
+    google_auth = _ensure_package("google.auth")
+    try:
+        import google.auth.exceptions  # noqa: F401
+    except ImportError:
+        google_auth.exceptions = _module("google.auth.exceptions", RefreshError=type("RefreshError", (Exception,), {}))
+
+    google.oauth2 = _ensure_package("google.oauth2")
+    google.oauth2.credentials = _module("google.oauth2.credentials", Credentials=lambda token=None: token)
+
+    googleapiclient = _ensure_package("googleapiclient")
+    googleapiclient.discovery = _module("googleapiclient.discovery", build=lambda *a, **k: FakeService(google_store))
+    # Always the fake, so the batch engine's status checks see FakeHttpError
+    googleapiclient.errors = _module("googleapiclient.errors", HttpError=FakeHttpError)
@@ -0,0 +1,187 @@
+"""Server-side chat conversations as append-only turn records.
+
+    users/{uid}/conversations/{conversation_id}               title, turn count, timestamps
+    users/{uid}/conversations/{conversation_id}/turns/{seq}   one message, never rewritten
+
+Turns get consecutive sequence numbers inside a transaction, so concurrent
+appends to the same conversation can't collide, and the sequence doubles as
+the pagination cursor. A chat message costs one read and three small writes
+no matter how long the conversation is, and the client only sends the new
+message plus the conversation id.
+"""
+import re
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.resilience import guarded
+
+CONVERSATIONS_COLLECTION = "conversations"
+TURNS_COLLECTION = "turns"
+
+TITLE_CHARS = 30 # Same as the client's history list
+MAX_WRITES_PER_BATCH = 500
+# Turns one append_turns call can write: its transaction also rewrites the metadata
+MAX_TURNS_PER_APPEND = MAX_WRITES_PER_BATCH - 1
+
+# Client-generated ids (crypto.randomUUID()); also keeps "/" out of document paths
+_CONVERSATION_ID = re.compile(r"^[A-Za-z0-9_-]{1,128}$")
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def valid_conversation_id(conversation_id: str) -> bool:
+    return bool(_CONVERSATION_ID.match(conversation_id))
+
+
+def _conversation_ref(db, uid: str, conversation_id: str):
+    return db.collection("users").document(uid).collection(CONVERSATIONS_COLLECTION).document(conversation_id)
+
+
+def _turn_id(seq: int) -> str:
+    # Zero-padded so document ids sort like the sequence
+    return f"{seq:08d}"
+
+
+def conversation_view(conversation_id: str, meta: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": conversation_id,
+        "title": meta.get("title"),
+        "turnCount": meta.get("last_seq", 0),
+        "createdAt": meta.get("created_at"),
+        "updatedAt": meta.get("updated_at"),
+    }
+
+
+def turn_view(turn: Dict[str, Any]) -> Dict[str, Any]:
+    view = {
+        "seq": turn["seq"],
+        "role": turn["role"],
+        "content": turn["content"],
+        "createdAt": turn.get("created_at"),
+    }
+    if turn.get("actions"):
+        view["actions"] = turn["actions"]
+    return view
+
+
+def append_turns(db, uid: str, conversation_id: str, turns: List[Dict[str, Any]], import_total: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Append turns ({role, content, actions?}) and return them with their seq.
+
+    The conversation is created by its first append, so clients pick the id.
+    At most MAX_TURNS_PER_APPEND turns fit in one call. ``import_total`` marks
+    a conversation imported from the old blob with that many turns, so an
+    interrupted import can tell how far it got (see ``import_progress``).
+    """
+    from firebase_admin import firestore
+
+    conversation_ref = _conversation_ref(db, uid, conversation_id)
+    turns_ref = conversation_ref.collection(TURNS_COLLECTION)
+
+    @firestore.transactional
+    def append(transaction):
+        snapshot = conversation_ref.get(transaction=transaction)
+        meta = snapshot.to_dict() if snapshot.exists else {}
+        last_seq = meta.get("last_seq", 0)
+        now = _now_iso()
+
+        written = []
+        for turn in turns:
+            last_seq += 1
+            record = {
+                "seq": last_seq,
+                "role": turn["role"],
+                "content": turn["content"],
+                "created_at": now,
+            }
+            if turn.get("actions"):
+                record["actions"] = turn["actions"]
+            # create() fails instead of overwriting, keeping turns append-only
+            transaction.create(turns_ref.document(_turn_id(last_seq)), record)
+            written.append(record)
+
+        last_user = next((t["content"] for t in reversed(turns) if t["role"] == "user"), None)
+        updated = {
+            "title": (last_user or meta.get("title") or "Nova Conversa")[:TITLE_CHARS],
+            "last_seq": last_seq,
+            "created_at": meta.get("created_at") or now,
+            "updated_at": now,
+        }
+        if import_total or meta.get("import_total"):
+            updated["import_total"] = import_total or meta["import_total"]
+        transaction.set(conversation_ref, updated)
+        return written
+
+    return guarded("firestore", "transaction", lambda: append(db.transaction()))
+
+
+def import_progress(meta: Optional[Dict[str, Any]]) -> Optional[int]:
+    """Turns already written by an unfinished import, or None if there's nothing to resume.
+
+    Imports write the blob's turns in order from seq 1, so ``last_seq`` is
+    how many of them made it.
+    """
+    if not meta or not meta.get("import_total"):
+        return None
+    last_seq = meta.get("last_seq", 0)
+    return last_seq if last_seq < meta["import_total"] else None
+
+
+def recent_turns(db, uid: str, conversation_id: str, limit: int) -> List[Dict[str, Any]]:
+    """The last ``limit`` turns, oldest first (the model's chat history)."""
+    turns, _ = list_turns(db, uid, conversation_id, before=None, limit=limit)
+    return turns
+
+
+def list_turns(db, uid: str, conversation_id: str, before: Optional[int], limit: int) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """A page of turns older than ``before`` (newest page when None), oldest first.
+
+    Returns the page and the cursor for the next, older page (None at the start).
+    """
+    from firebase_admin import firestore
+
+    query = _conversation_ref(db, uid, conversation_id).collection(TURNS_COLLECTION)
+    if before is not None:
+        query = query.where("seq", "<", before)
+    query = query.order_by("seq", direction=firestore.Query.DESCENDING).limit(limit + 1)
+
+    docs = guarded("firestore", "stream", lambda: list(query.stream()), idempotent=True, hedge=True)
+    turns = [doc.to_dict() for doc in docs]
+    has_more = len(turns) > limit
+    turns = turns[:limit]
+    turns.reverse()
+    return turns, (turns[0]["seq"] if has_more and turns else None)
+
+
+def get_conversation(db, uid: str, conversation_id: str) -> Optional[Dict[str, Any]]:
+    snapshot = guarded("firestore", "get", _conversation_ref(db, uid, conversation_id).get, idempotent=True, hedge=True)
+    return snapshot.to_dict() if snapshot.exists else None
+
+
+def list_conversations(db, uid: str, before: Optional[str], limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Conversations by last activity, newest first; the cursor is an ``updatedAt``."""
+    from firebase_admin import firestore
+
+    query = db.collection("users").document(uid).collection(CONVERSATIONS_COLLECTION)
+    if before:
+        query = query.where("updated_at", "<", before)
+    query = query.order_by("updated_at", direction=firestore.Query.DESCENDING).limit(limit + 1)
+
+    docs = guarded("firestore", "stream", lambda: list(query.stream()), idempotent=True, hedge=True)
+    conversations = [conversation_view(doc.id, doc.to_dict()) for doc in docs]
+    has_more = len(conversations) > limit
+    conversations = conversations[:limit]
+    return conversations, (conversations[-1]["updatedAt"] if has_more else None)
+
+
+def delete_conversation(db, uid: str, conversation_id: str) -> None:
+    conversation_ref = _conversation_ref(db, uid, conversation_id)
+    turns_ref = conversation_ref.collection(TURNS_COLLECTION)
+    refs = [doc.reference for doc in guarded("firestore", "stream", lambda: list(turns_ref.stream()), idempotent=True)]
+    refs.append(conversation_ref)
+    for i in range(0, len(refs), MAX_WRITES_PER_BATCH):
+        batch = db.batch()
+        for ref in refs[i:i + MAX_WRITES_PER_BATCH]:
+            batch.delete(ref)
+        guarded("firestore", "batch.commit", batch.commit, idempotent=True)
@@ -0,0 +1,48 @@
+"""Lazy Firebase Admin setup.
+
+firebase_admin pulls in google-cloud-firestore and grpc, which dominates cold
+start time, so nothing here is imported or initialized until the first
+request that needs it.
+"""
+import os
+import threading
+
+# We look for serviceAccountKey.json in the backend directory
+CRED_PATH = os.path.join(os.path.dirname(__file__), "serviceAccountKey.json")
+
+_init_lock = threading.Lock()
+_warned = False
+
+
+def init_firebase() -> bool:
+    """Initialize Firebase Admin once; returns whether it is available."""
+    global _warned
+    import firebase_admin
+
+    if firebase_admin._apps:
+        return True
+
+    with _init_lock:
+        if firebase_admin._apps:
+            return True
+        if not os.path.exists(CRED_PATH):
+            if not _warned:
+                print(f"[Python] Warning: {CRED_PATH} not found. Firebase features will not work until you add the file.")
+                _warned = True
+            return False
+        try:
+            from firebase_admin import credentials
+            firebase_admin.initialize_app(credentials.Certificate(CRED_PATH))
+            print("[Python] Firebase Admin initialized successfully")
+        except Exception as e:
+            print(f"[Python] Error initializing Firebase Admin: {e}")
+            return False
+
+    return True
+
+
+def get_db():
+    """Firestore client, initializing Firebase on first use."""
+    init_firebase()
+    from firebase_admin import firestore
+    return firestore.client()
@@ -0,0 +1,157 @@
+import contextvars
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from googleapiclient.errors import HttpError
+
+from backend.resilience import UpstreamError, guarded
+
+# Google rejects batch requests with more than 50 inner calls
+MAX_BATCH_SIZE = 50
+MAX_CONCURRENT_BATCHES = 4
+MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 16.0
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+# A batch item is (key, build_request). build_request receives a service and
+# returns the HttpRequest to add to the batch, e.g.
+#   lambda service: service.events().delete(calendarId='primary', eventId=...)
+BatchItem = Tuple[str, Callable[[Any], Any]]
+
+
+def _chunks(items: List[Any], size: int) -> List[List[Any]]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _is_retryable(error: Exception) -> bool:
+    if not isinstance(error, HttpError):
+        return False
+    status = error.resp.status
+    if status in RETRYABLE_STATUSES:
+        return True
+    # Calendar and Tasks report quota errors as 403 with a rate limit reason
+    if status == 403:
+        try:
+            reasons = {d.get("reason") for d in (error.error_details or []) if isinstance(d, dict)}
+        except Exception:
+            reasons = set()
+        return bool(reasons & RATE_LIMIT_REASONS) or "Rate Limit" in str(error)
+    return False
+
+
+def _backoff(attempt: int) -> float:
+    # Full jitter: sleep a random amount up to the capped exponential delay
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+
+def _run_chunk(
+    service_factory: Callable[[], Any],
+    chunk: List[BatchItem],
+    max_retries: int,
+    upstream: str,
+) -> Tuple[Dict[str, Any], Dict[str, Exception]]:
+    # httplib2 is not thread-safe, so every worker builds its own service
+    service = service_factory()
+    succeeded: Dict[str, Any] = {}
+    failed: Dict[str, Exception] = {}
+    builders = dict(chunk)
+    pending = [key for key, _ in chunk]
+
+    for attempt in range(max_retries + 1):
+        errors: Dict[str, Exception] = {}
+        responses: Dict[str, Any] = {}
+
+        def callback(request_id, response, exception):
+            if exception:
+                errors[request_id] = exception
+            else:
+                responses[request_id] = response
+
+        batch = service.new_batch_http_request(callback=callback)
+        for key in pending:
+            batch.add(builders[key](service), request_id=key)
+
+        try:
+            # Not retried or hedged as a whole: inserts are not idempotent, and
+            # per-item retries below already cover 429/5xx
+            guarded(upstream, "batch", batch.execute)
+        except (HttpError, UpstreamError) as e:
+            # The whole batch was rejected, timed out or refused by the breaker;
+            # every pending item shares the error
+            for key in pending:
+                errors[key] = e
+        else:
+            succeeded.update(responses)
+
+        retry = [key for key, err in errors.items() if _is_retryable(err)]
+        for key, err in errors.items():
+            if key not in retry:
+                failed[key] = err
+
+        if not retry:
+            return succeeded, failed
+        if attempt == max_retries:
+            for key in retry:
+                failed[key] = errors[key]
+            return succeeded, failed
+
+        pending = retry
+        time.sleep(_backoff(attempt))
+
+    return succeeded, failed
+
+
+def execute_batched(
+    service_factory: Callable[[], Any],
+    items: List[BatchItem],
+    batch_size: int = MAX_BATCH_SIZE,
+    max_concurrency: int = MAX_CONCURRENT_BATCHES,
+    max_retries: int = MAX_RETRIES,
+    upstream: str = "google",
+) -> Tuple[Dict[str, Any], Dict[str, Exception]]:
+    """Run items through Google batch HTTP requests.
+
+    Items are split into chunks of at most ``batch_size`` calls, chunks run
+    concurrently up to ``max_concurrency`` and items failing with 429/5xx are
+    retried with jittered exponential backoff. Returns ``(succeeded, failed)``
+    dicts keyed by item key.
+    """
+    if not items:
+        return {}, {}
+
+    batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+    chunks = _chunks(items, batch_size)
+
+    succeeded: Dict[str, Any] = {}
+    failed: Dict[str, Exception] = {}
+
+    if len(chunks) == 1 or max_concurrency <= 1:
+        results = [_run_chunk(service_factory, chunk, max_retries, upstream) for chunk in chunks]
+    else:
+        # Copy the caller's context into each worker so request spans keep being recorded
+        contexts = [contextvars.copy_context() for _ in chunks]
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(chunks))) as pool:
+            results = list(pool.map(
+                lambda ctx, chunk: ctx.run(_run_chunk, service_factory, chunk, max_retries, upstream),
+                contexts,
+                chunks,
+            ))
+
+    for chunk_succeeded, chunk_failed in results:
+        succeeded.update(chunk_succeeded)
+        failed.update(chunk_failed)
+
+    return succeeded, failed
+
+
+def error_status(error: Exception) -> Optional[int]:
+    if isinstance(error, HttpError):
+        return error.resp.status
+    if isinstance(error, UpstreamError):
+        return error.status_code
+    return None
@@ -0,0 +1,173 @@
+from bisect import bisect_left
+from datetime import date, datetime, time, timedelta, tzinfo
+from heapq import heappop, heappush
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from backend.schedule_compiler import normalize_activity, _parse_hhmm, _sunday_based_weekday
+
+# (start, end, payload) with start/end as POSIX timestamps
+Interval = Tuple[float, float, Any]
+
+
+class IntervalIndex:
+    """Static index over half-open intervals for overlap queries.
+
+    Intervals are sorted by start, and a max segment tree over their ends
+    lets a query descend only into ranges holding an interval that reaches
+    past the query start. A query costs O((k + 1) log n) for k results, so
+    one long busy block (a trip, a whole term) doesn't slow down the rest.
+    """
+
+    def __init__(self, intervals: List[Interval]):
+        self.intervals = sorted(intervals, key=lambda iv: (iv[0], iv[1]))
+        self.starts = [iv[0] for iv in self.intervals]
+        size = 1
+        while size < len(self.intervals):
+            size *= 2
+        self.size = size
+        # tree[size + i] is the end of interval i; inner nodes hold their children's max
+        tree = [float("-inf")] * (2 * size)
+        for i, iv in enumerate(self.intervals):
+            tree[size + i] = iv[1]
+        for node in range(size - 1, 0, -1):
+            tree[node] = max(tree[2 * node], tree[2 * node + 1])
+        self.max_end = tree
+
+    def __len__(self) -> int:
+        return len(self.intervals)
+
+    def overlapping(self, start: float, end: float) -> List[Interval]:
+        found = []
+        limit = bisect_left(self.starts, end) # only intervals starting before the query end
+        tree = self.max_end
+        stack = [(1, 0, self.size)]
+        while stack:
+            node, lo, hi = stack.pop()
+            if lo >= limit or tree[node] <= start:
+                continue
+            if hi - lo == 1:
+                found.append(self.intervals[lo])
+                continue
+            mid = (lo + hi) // 2
+            # Right first so intervals come out in start order
+            stack.append((2 * node + 1, mid, hi))
+            stack.append((2 * node, lo, mid))
+        return found
+
+
+def merge_intervals(intervals: List[Interval]) -> List[Tuple[float, float]]:
+    """Union of the given intervals as sorted, disjoint (start, end) pairs."""
+    merged: List[List[float]] = []
+    for start, end, _ in sorted(intervals, key=lambda iv: iv[0]):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(s, e) for s, e in merged]
+
+
+def expand_weekly(
+    activities: List[Dict[str, Any]],
+    window_start: datetime,
+    window_end: datetime,
+    tz: tzinfo,
+) -> List[Interval]:
+    """Expand weekly activities into concrete occurrences inside the window."""
+    occurrences: List[Interval] = []
+    first_day = window_start.astimezone(tz).date()
+    last_day = window_end.astimezone(tz).date()
+    lo, hi = window_start.timestamp(), window_end.timestamp()
+
+    for activity in activities:
+        title, start_time, end_time = normalize_activity(activity)
+        day = int(activity.get("day_of_week", 0)) % 7
+        start, end = _parse_hhmm(start_time), _parse_hhmm(end_time)
+        current = first_day + timedelta(days=(day - _sunday_based_weekday(first_day)) % 7)
+        while current <= last_day:
+            start_dt = datetime.combine(current, start, tzinfo=tz)
+            end_dt = datetime.combine(current, end, tzinfo=tz)
+            if end_dt <= start_dt:
+                end_dt += timedelta(days=1)
+            s, e = start_dt.timestamp(), end_dt.timestamp()
+            if e > lo and s < hi:
+                occurrences.append((s, e, {"id": activity.get("id"), "title": title, "day_of_week": day}))
+            current += timedelta(days=7)
+
+    return occurrences
+
+
+def find_conflicts(activities: List[Interval], busy: List[Interval]) -> List[Tuple[Interval, Interval]]:
+    """Pairs (activity, other) where an activity overlaps a busy block or another activity."""
+    conflicts = []
+    busy_index = IntervalIndex(busy)
+    for activity in activities:
+        for block in busy_index.overlapping(activity[0], activity[1]):
+            conflicts.append((activity, block))
+
+    # Sweep line over activities: pair each start with the occurrences still open
+    ordered = sorted(activities, key=lambda iv: (iv[0], iv[1]))
+    open_ends: List[Tuple[float, int]] = []
+    for position, activity in enumerate(ordered):
+        while open_ends and open_ends[0][0] <= activity[0]:
+            heappop(open_ends)
+        for _, other in open_ends:
+            conflicts.append((ordered[other], activity))
+        heappush(open_ends, (activity[1], position))
+
+    return conflicts
+
+
+def _day_windows(
+    window_start: datetime,
+    window_end: datetime,
+    tz: tzinfo,
+    day_start: time,
+    day_end: time,
+) -> Iterator[Tuple[float, float]]:
+    current: date = window_start.astimezone(tz).date()
+    last = window_end.astimezone(tz).date()
+    lo, hi = window_start.timestamp(), window_end.timestamp()
+    while current <= last:
+        s = max(lo, datetime.combine(current, day_start, tzinfo=tz).timestamp())
+        e = min(hi, datetime.combine(current, day_end, tzinfo=tz).timestamp())
+        if e > s:
+            yield s, e
+        current += timedelta(days=1)
+
+
+def free_slots(
+    busy: List[Tuple[float, float]],
+    window_start: datetime,
+    window_end: datetime,
+    duration: timedelta,
+    tz: tzinfo,
+    day_start: time = time(0, 0),
+    day_end: time = time(23, 59),
+    limit: Optional[int] = None,
+) -> List[Tuple[float, float, float]]:
+    """Earliest gaps of at least ``duration`` between merged busy blocks.
+
+    ``busy`` must be sorted and disjoint (see ``merge_intervals``). Returns
+    ``(slot_start, slot_end, gap_end)`` tuples, at most ``limit`` of them.
+    """
+    needed = duration.total_seconds()
+    slots = []
+    i = 0
+
+    for day_lo, day_hi in _day_windows(window_start, window_end, tz, day_start, day_end):
+        while i < len(busy) and busy[i][1] <= day_lo:
+            i += 1
+        cursor = day_lo
+        j = i
+        while cursor < day_hi:
+            gap_end = min(day_hi, busy[j][0]) if j < len(busy) else day_hi
+            if gap_end - cursor >= needed:
+                slots.append((cursor, cursor + needed, gap_end))
+                if limit is not None and len(slots) >= limit:
+                    return slots
+            if j >= len(busy) or busy[j][0] >= day_hi:
+                break
+            cursor = max(cursor, busy[j][1])
+            j += 1
+
+    return slots
@@ -0,0 +1,461 @@
+"""Background jobs for operations too long for one HTTP request.
+
+Endpoints enqueue a job and answer 202 with its id; an in-process runner
+executes it on a worker thread, at most JOBS_MAX_CONCURRENCY at a time, and
+clients poll /api/jobs/{id} for progress and the result.
+
+Jobs are persisted (SQLite locally, Firestore on Vercel where the disk is
+read-only, or JOBS_BACKEND to choose) and held through a lease that the
+runner renews while the job runs. A job whose lease expired (the process
+died or was frozen mid-run) is claimed again when a runner next starts (on
+the first jobs request of a process) or sweeps, and resumes from its last
+checkpoint. The payload is stored as received,
+including the Google access token, so a resumed job keeps working only while
+that token is valid.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+JOBS_BACKEND = os.getenv("JOBS_BACKEND") or ("firestore" if os.getenv("VERCEL") else "sqlite")
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", os.path.join(os.path.dirname(__file__), "jobs.sqlite3"))
+JOBS_MAX_CONCURRENCY = int(os.getenv("JOBS_MAX_CONCURRENCY", "2"))
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "3"))
+LEASE_SECONDS = float(os.getenv("JOBS_LEASE_SECONDS", "120"))
+
+JOBS_COLLECTION = "jobs"
+# A job is one Firestore document (1 MiB max) holding the payload plus progress and result
+MAX_PAYLOAD_BYTES = 768 * 1024
+
+
+class PayloadTooLarge(ValueError):
+    def __init__(self, size: int):
+        super().__init__(f"Job payload is {size // 1024} KiB; the limit is {MAX_PAYLOAD_BYTES // 1024} KiB. Split it into smaller jobs.")
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class JobStore:
+    """Persistence for job records (plain dicts, see ``new_job``)."""
+
+    def create(self, job: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def get(self, uid: str, job_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def list(self, uid: str, limit: int) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def update(self, uid: str, job_id: str, fields: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def claim(self, uid: str, job_id: str, owner: str, lease_until: float) -> Optional[Dict[str, Any]]:
+        """Atomically take a queued job, or a running one whose lease expired."""
+        raise NotImplementedError
+
+    def claimable(self, now: float) -> List[Tuple[str, str]]:
+        """(uid, job_id) of every unfinished job nobody holds a lease on."""
+        raise NotImplementedError
+
+
+class SQLiteJobStore(JobStore):
+    JSON_FIELDS = ("payload", "checkpoint", "result")
+    COLUMNS = (
+        "id", "uid", "kind", "status", "payload", "checkpoint", "result", "error",
+        "done", "total", "attempts", "owner", "lease_until", "created_at", "updated_at",
+    )
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                uid TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                payload TEXT,
+                checkpoint TEXT,
+                result TEXT,
+                error TEXT,
+                done INTEGER NOT NULL DEFAULT 0,
+                total INTEGER,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                owner TEXT,
+                lease_until REAL,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_uid_created ON jobs (uid, created_at)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+
+    def _encode(self, fields: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: json.dumps(v) if k in self.JSON_FIELDS and v is not None else v for k, v in fields.items()}
+
+    def _decode(self, row) -> Dict[str, Any]:
+        job = dict(row)
+        for field in self.JSON_FIELDS:
+            if job[field] is not None:
+                job[field] = json.loads(job[field])
+        return job
+
+    def create(self, job):
+        row = self._encode(job)
+        columns = [c for c in self.COLUMNS if c in row]
+        with self.lock:
+            self.conn.execute(
+                f"INSERT INTO jobs ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                [row[c] for c in columns],
+            )
+
+    def get(self, uid, job_id):
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM jobs WHERE id = ? AND uid = ?", (job_id, uid)).fetchone()
+        return self._decode(row) if row else None
+
+    def list(self, uid, limit):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT * FROM jobs WHERE uid = ? ORDER BY created_at DESC LIMIT ?", (uid, limit)
+            ).fetchall()
+        return [self._decode(row) for row in rows]
+
+    def update(self, uid, job_id, fields):
+        row = self._encode(fields)
+        with self.lock:
+            self.conn.execute(
+                f"UPDATE jobs SET {', '.join(f'{c} = ?' for c in row)} WHERE id = ? AND uid = ?",
+                [*row.values(), job_id, uid],
+            )
+
+    def claim(self, uid, job_id, owner, lease_until):
+        with self.lock:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET status = ?, owner = ?, lease_until = ?, attempts = attempts + 1, updated_at = ? "
+                "WHERE id = ? AND uid = ? AND (status = ? OR (status = ? AND (lease_until IS NULL OR lease_until < ?)))",
+                (RUNNING, owner, lease_until, _now_iso(), job_id, uid, QUEUED, RUNNING, time.time()),
+            )
+            if cursor.rowcount != 1:
+                return None
+            row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._decode(row)
+
+    def claimable(self, now):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT uid, id FROM jobs WHERE status = ? OR (status = ? AND (lease_until IS NULL OR lease_until < ?)) "
+                "ORDER BY created_at",
+                (QUEUED, RUNNING, now),
+            ).fetchall()
+        return [(row["uid"], row["id"]) for row in rows]
+
+
+class FirestoreJobStore(JobStore):
+    """Jobs under users/{uid}/jobs, like the rest of the user's data."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def _ref(self, uid: str, job_id: str):
+        return self.db.collection("users").document(uid).collection(JOBS_COLLECTION).document(job_id)
+
+    def create(self, job):
+        self._ref(job["uid"], job["id"]).set(job)
+
+    def get(self, uid, job_id):
+        snapshot = self._ref(uid, job_id).get()
+        return snapshot.to_dict() if snapshot.exists else None
+
+    def list(self, uid, limit):
+        from firebase_admin import firestore
+
+        query = (
+            self.db.collection("users").document(uid).collection(JOBS_COLLECTION)
+            .order_by("created_at", direction=firestore.Query.DESCENDING)
+            .limit(limit)
+        )
+        return [doc.to_dict() for doc in query.stream()]
+
+    def update(self, uid, job_id, fields):
+        self._ref(uid, job_id).update(fields)
+
+    def claim(self, uid, job_id, owner, lease_until):
+        from firebase_admin import firestore
+
+        ref = self._ref(uid, job_id)
+
+        @firestore.transactional
+        def take(transaction):
+            snapshot = ref.get(transaction=transaction)
+            job = snapshot.to_dict() if snapshot.exists else None
+            if not job or not _claimable(job, time.time()):
+                return None
+            fields = {
+                "status": RUNNING,
+                "owner": owner,
+                "lease_until": lease_until,
+                "attempts": job.get("attempts", 0) + 1,
+                "updated_at": _now_iso(),
+            }
+            transaction.update(ref, fields)
+            return {**job, **fields}
+
+        return take(self.db.transaction())
+
+    def claimable(self, now):
+        query = self.db.collection_group(JOBS_COLLECTION).where("status", "in", [QUEUED, RUNNING])
+        return [(job["uid"], job["id"]) for job in (doc.to_dict() for doc in query.stream()) if _claimable(job, now)]
+
+
+def _claimable(job: Dict[str, Any], now: float) -> bool:
+    if job.get("status") == QUEUED:
+        return True
+    return job.get("status") == RUNNING and (job.get("lease_until") or 0) < now
+
+
+def new_job(uid: str, kind: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    now = _now_iso()
+    return {
+        "id": uuid.uuid4().hex,
+        "uid": uid,
+        "kind": kind,
+        "status": QUEUED,
+        "payload": payload,
+        "checkpoint": None,
+        "result": None,
+        "error": None,
+        "done": 0,
+        "total": None,
+        "attempts": 0,
+        "owner": None,
+        "lease_until": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+def public_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    """What clients see when polling; the payload (with its token) stays private."""
+    return {
+        "id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "progress": {"done": job.get("done") or 0, "total": job.get("total")},
+        "result": job.get("result"),
+        "error": job.get("error"),
+        "attempts": job.get("attempts", 0),
+        "createdAt": job.get("created_at"),
+        "updatedAt": job.get("updated_at"),
+    }
+
+
+class JobContext:
+    """Handed to a handler: its payload, last checkpoint and progress reporting."""
+
+    def __init__(self, store: JobStore, job: Dict[str, Any]):
+        self.store = store
+        self.id = job["id"]
+        self.uid = job["uid"]
+        self.payload = job["payload"]
+        self.checkpoint = job.get("checkpoint")
+        self.resumed = job.get("checkpoint") is not None
+
+    def progress(self, done: int, total: Optional[int] = None, checkpoint: Optional[Dict[str, Any]] = None) -> None:
+        """Record progress; with a checkpoint, a resumed run continues from it."""
+        fields: Dict[str, Any] = {"done": done, "updated_at": _now_iso()}
+        if total is not None:
+            fields["total"] = total
+        if checkpoint is not None:
+            self.checkpoint = checkpoint
+            fields["checkpoint"] = checkpoint
+        self.store.update(self.uid, self.id, fields)
+
+
+# kind -> handler(JobContext) returning the job's JSON result
+HANDLERS: Dict[str, Callable[[JobContext], Any]] = {}
+
+
+def register(kind: str):
+    def decorator(handler: Callable[[JobContext], Any]):
+        HANDLERS[kind] = handler
+        return handler
+    return decorator
+
+
+class JobRunner:
+    def __init__(self, store: JobStore, max_concurrency: int = JOBS_MAX_CONCURRENCY):
+        self.store = store
+        self.owner = uuid.uuid4().hex
+        self.max_concurrency = max_concurrency
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.tasks: set = set()
+        # Jobs scheduled here and not finished yet, queued or running
+        self.in_flight: set = set()
+        self.sweeper: Optional[asyncio.Task] = None
+        self.starting: Optional[asyncio.Task] = None
+
+    def _schedule(self, uid: str, job_id: str) -> bool:
+        if job_id in self.in_flight:
+            return False
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.in_flight.add(job_id)
+        task = asyncio.get_running_loop().create_task(self._run(uid, job_id))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        task.add_done_callback(lambda _: self.in_flight.discard(job_id))
+        return True
+
+    async def enqueue(self, uid: str, kind: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        if kind not in HANDLERS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        size = len(json.dumps(payload, separators=(",", ":")).encode())
+        if size > MAX_PAYLOAD_BYTES:
+            raise PayloadTooLarge(size)
+        job = new_job(uid, kind, payload)
+        await asyncio.to_thread(self.store.create, job)
+        self._schedule(uid, job["id"])
+        return job
+
+    async def _heartbeat(self, uid: str, job_id: str) -> None:
+        delay = LEASE_SECONDS / 3
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await asyncio.to_thread(self.store.update, uid, job_id, {"lease_until": time.time() + LEASE_SECONDS})
+                delay = LEASE_SECONDS / 3
+            except Exception as e:
+                # Keep trying well inside the lease; another process would take the job once it expires
+                print(f"Error renewing lease of job {job_id}: {e}")
+                delay = min(5.0, LEASE_SECONDS / 10)
+
+    async def _run(self, uid: str, job_id: str) -> None:
+        async with self.semaphore:
+            try:
+                job = await asyncio.to_thread(self.store.claim, uid, job_id, self.owner, time.time() + LEASE_SECONDS)
+            except Exception as e:
+                # Left as it was; the next sweep tries to claim it again
+                print(f"Error claiming job {job_id}: {e}")
+                return
+            if job is None:
+                # Finished, or another process holds it
+                return
+
+            if job["attempts"] > JOBS_MAX_ATTEMPTS:
+                await asyncio.to_thread(self.store.update, uid, job_id, {
+                    "status": FAILED,
+                    "error": f"Gave up after {JOBS_MAX_ATTEMPTS} interrupted attempts",
+                    "updated_at": _now_iso(),
+                })
+                return
+
+            heartbeat = asyncio.create_task(self._heartbeat(uid, job_id))
+            try:
+                result = await asyncio.to_thread(HANDLERS[job["kind"]], JobContext(self.store, job))
+                fields = {"status": SUCCEEDED, "result": result, "error": None}
+            except Exception as e:
+                print(f"Error running job {job_id} ({job['kind']}): {e}")
+                fields = {"status": FAILED, "error": _describe(e)}
+            finally:
+                heartbeat.cancel()
+            fields.update({"lease_until": None, "updated_at": _now_iso()})
+            await asyncio.to_thread(self.store.update, uid, job_id, fields)
+
+    async def resume(self) -> int:
+        """Schedule every job left unfinished by a previous process.
+
+        Jobs this runner already has queued or running are skipped, even when
+        their lease looks expired, so they never run twice in one process.
+        """
+        pending = await asyncio.to_thread(self.store.claimable, time.time())
+        return sum(self._schedule(uid, job_id) for uid, job_id in pending)
+
+    async def _sweep(self) -> None:
+        while True:
+            await asyncio.sleep(LEASE_SECONDS)
+            try:
+                await self.resume()
+            except Exception as e:
+                print(f"Error resuming jobs: {e}")
+
+    async def start(self) -> None:
+        try:
+            resumed = await self.resume()
+            if resumed:
+                print(f"[Python] Resuming {resumed} unfinished job(s)")
+        except Exception as e:
+            print(f"[Python] Error resuming jobs: {e}")
+        if self.sweeper is None:
+            self.sweeper = asyncio.create_task(self._sweep())
+
+    def ensure_started(self) -> None:
+        """Start resuming and sweeping once, in the background."""
+        if self.starting is None:
+            self.starting = asyncio.get_running_loop().create_task(self.start())
+
+    async def stop(self) -> None:
+        # Running jobs are left in place; their lease runs out and the next process resumes them
+        if self.starting:
+            self.starting.cancel()
+            self.starting = None
+        if self.sweeper:
+            self.sweeper.cancel()
+            self.sweeper = None
+        for task in list(self.tasks):
+            task.cancel()
+
+
+def _describe(error: Exception) -> str:
+    if type(error).__name__ == "RefreshError":
+        return "Google token expired"
+    return str(error)
+
+
+_runner: Optional[JobRunner] = None
+_runner_lock = threading.Lock()
+
+
+def get_runner() -> JobRunner:
+    global _runner
+    if _runner is None:
+        with _runner_lock:
+            if _runner is None:
+                if JOBS_BACKEND == "firestore":
+                    from backend.firebase import get_db
+                    store: JobStore = FirestoreJobStore(get_db())
+                else:
+                    store = SQLiteJobStore(JOBS_DB_PATH)
+                _runner = JobRunner(store)
+    return _runner
+
+
+async def ensure_runner() -> JobRunner:
+    """The runner, started on the first enqueue or jobs request.
+
+    Not started at boot: on Vercel that would initialize Firestore and run the
+    resume query on every cold start, for instances that never see a job.
+    """
+    # Opening the store may initialize Firebase, so it happens off the event loop
+    runner = await asyncio.to_thread(get_runner)
+    runner.ensure_started()
+    return runner
+
+
+async def stop_runner() -> None:
+    if _runner is not None:
+        await _runner.stop()
@@ -1,16 +1,28 @@
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from backend.routers import gemini, auth, data, calendar, tasks
 import os
 from dotenv import load_dotenv
 
+# Load .env once, before the routers read any configuration
 load_dotenv()
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.middleware.cors import CORSMiddleware
+from backend.routers import gemini, auth, data, calendar, tasks, sync, jobs as jobs_router, search, conversations
+from backend import jobs
+from backend.metrics import MetricsMiddleware, register_routes, render_latest, CONTENT_TYPE_LATEST
+from backend.tracing import TimingMiddleware
+from backend.compression import CompressionMiddleware
+from backend.responses import FastJSONResponse
+from fastapi.responses import JSONResponse, Response
 import traceback
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The job runner starts on first use (see jobs.ensure_runner)
+    yield
+    await jobs.stop_runner()
+
+app = FastAPI(default_response_class=FastJSONResponse, lifespan=lifespan)
 
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -29,6 +41,11 @@ origins = [
     "*", # Allow all origins for initial Vercel deployment
 ]
 
+# Innermost, so metrics and Server-Timing see the compressed response
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TimingMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -38,12 +55,26 @@ app.add_middleware(
 )
 
 # Incluir rotas
-app.include_router(gemini.router, prefix="/api/gemini", tags=["gemini"])
-app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
-app.include_router(data.router, prefix="/api/data", tags=["data"])
-app.include_router(calendar.router, prefix="/api/calendar", tags=["calendar"])
-app.include_router(tasks.router, prefix="/api/tasks", tags=["tasks"])
+def include(router, prefix: str, tag: str):
+    app.include_router(router, prefix=prefix, tags=[tag])
+    # Metrics and request logs label by the full path template
+    register_routes(router, prefix)
+
+include(gemini.router, "/api/gemini", "gemini")
+include(auth.router, "/api/auth", "auth")
+include(data.router, "/api/data", "data")
+include(calendar.router, "/api/calendar", "calendar")
+include(tasks.router, "/api/tasks", "tasks")
+include(sync.router, "/api/sync", "sync")
+include(jobs_router.router, "/api/jobs", "jobs")
+include(search.router, "/api/search", "search")
+include(conversations.router, "/api/conversations", "conversations")
 
 @app.get("/")
 def read_root():
     return {"message": "Backend is running"}
+
+@app.get("/api/metrics")
+def metrics():
+    # Prometheus scrape endpoint (under /api so the Vercel rewrite reaches it)
+    return Response(content=render_latest(), media_type=CONTENT_TYPE_LATEST)
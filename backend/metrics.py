@@ -0,0 +1,218 @@
+"""In-process metrics with Prometheus text exposition.
+
+Kept dependency-free and cheap (one lock and a dict lookup per observation)
+so it can stay on in production. Values are per instance; on Vercel each
+warm instance reports its own series.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+from backend.tracing import span
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def get(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {value}" for labels, value in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels: str, value: float) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._values.items()]
+        lines = []
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            cumulative += series[len(self.buckets)]
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {series[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+def render_latest() -> str:
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+# HTTP side
+http_requests_total = Counter("http_requests_total", "HTTP requests by route and status.", ("method", "route", "status"))
+http_request_duration_seconds = Histogram("http_request_duration_seconds", "HTTP request latency.", ("method", "route"))
+http_requests_in_flight = Gauge("http_requests_in_flight", "HTTP requests currently being served.")
+http_request_errors_total = Counter("http_request_errors_total", "Unhandled exceptions by route and class.", ("route", "error_class"))
+
+# Upstream dependencies (gemini, firestore, firebase_auth, google_calendar, google_tasks)
+upstream_requests_total = Counter("upstream_requests_total", "Upstream calls by outcome.", ("upstream", "operation", "outcome"))
+upstream_request_duration_seconds = Histogram("upstream_request_duration_seconds", "Upstream call latency.", ("upstream", "operation"))
+upstream_in_flight = Gauge("upstream_in_flight", "Upstream calls currently in progress.", ("upstream",))
+upstream_errors_total = Counter("upstream_errors_total", "Upstream failures by error class.", ("upstream", "operation", "error_class"))
+
+
+def error_class(exc: BaseException) -> str:
+    # googleapiclient's HttpError carries the response; split it by status
+    status = getattr(getattr(exc, "resp", None), "status", None)
+    if status is not None:
+        return f"{type(exc).__name__}{status}"
+    return type(exc).__name__
+
+
+@contextmanager
+def track_upstream(upstream: str, operation: str) -> Iterator[None]:
+    """Record count, latency, in-flight and error class for one upstream call.
+
+    The call is also added as a span to the current request's Server-Timing.
+    """
+    upstream_in_flight.inc(upstream)
+    started = time.perf_counter()
+    try:
+        with span(f"{upstream}.{operation}"):
+            yield
+    except BaseException as exc:
+        upstream_requests_total.inc(upstream, operation, "error")
+        upstream_errors_total.inc(upstream, operation, error_class(exc))
+        raise
+    else:
+        upstream_requests_total.inc(upstream, operation, "ok")
+    finally:
+        upstream_request_duration_seconds.observe(time.perf_counter() - started, upstream, operation)
+        upstream_in_flight.dec(upstream)
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware; avoids the per-request overhead of BaseHTTPMiddleware."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_holder = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+            await send(message)
+
+        method = scope["method"]
+        http_requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as exc:
+            http_request_errors_total.inc(route_label(scope), error_class(exc))
+            raise
+        finally:
+            route = route_label(scope)
+            http_request_duration_seconds.observe(time.perf_counter() - started, method, route)
+            http_requests_total.inc(method, route, str(status_holder["status"]))
+            http_requests_in_flight.dec()
+
+
+# id(route) -> full path template. Routes of an included router keep their path
+# relative to it ("/" for both /api/search/ and /api/jobs/), so the prefix is
+# recorded when the router is included.
+_route_templates: Dict[int, str] = {}
+
+
+def register_routes(router, prefix: str) -> None:
+    for route in router.routes:
+        path = getattr(route, "path", None)
+        if path is not None:
+            _route_templates[id(route)] = prefix + path
+
+
+def route_label(scope) -> str:
+    # The router stores the matched route in the scope; using its template keeps
+    # label cardinality bounded (e.g. /api/data/{collection})
+    route = scope.get("route")
+    if route is None:
+        return "unmatched"
+    return _route_templates.get(id(route)) or getattr(route, "path", None) or "unmatched"
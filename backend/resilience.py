@@ -0,0 +1,356 @@
+"""Deadlines, circuit breakers, retries and hedged reads for upstream calls.
+
+Every call made through ``guarded()`` (or ``execute()`` for googleapiclient
+requests) runs on its upstream's own worker pool so it can be abandoned when
+the deadline passes, is refused fast while that upstream's breaker is open,
+and is recorded by ``track_upstream``. Separate pools keep a hung upstream
+from starving the others, and a call that never got a worker before its
+deadline is cancelled and does not count against the breaker. Idempotent
+calls get a couple of jittered retries within the same deadline, and reads
+can be hedged: if the first attempt hasn't answered after the upstream's
+hedge delay, a second one is started and whichever finishes first wins.
+"""
+import contextvars
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Optional
+
+from backend.metrics import Counter, Gauge, track_upstream
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+circuit_state = Gauge("upstream_circuit_state", "Breaker state per upstream (0=closed, 1=half-open, 2=open).", ("upstream",))
+circuit_transitions_total = Counter("upstream_circuit_transitions_total", "Breaker state changes.", ("upstream", "state"))
+upstream_rejected_total = Counter("upstream_rejected_total", "Calls refused because the breaker was open.", ("upstream",))
+upstream_timeouts_total = Counter("upstream_timeouts_total", "Calls abandoned at their deadline.", ("upstream", "operation"))
+upstream_retries_total = Counter("upstream_retries_total", "Retried idempotent calls.", ("upstream", "operation"))
+upstream_saturated_total = Counter("upstream_saturated_total", "Calls that waited for a worker past their deadline.", ("upstream", "operation"))
+upstream_hedges_total = Counter("upstream_hedges_total", "Hedged requests, by which attempt answered.", ("upstream", "operation", "winner"))
+
+
+class UpstreamError(Exception):
+    status_code = 503
+
+
+class UpstreamUnavailable(UpstreamError):
+    status_code = 503
+
+    def __init__(self, upstream: str):
+        super().__init__(f"{upstream} is unavailable (circuit open)")
+        self.upstream = upstream
+
+
+class UpstreamTimeout(UpstreamError):
+    status_code = 504
+
+    def __init__(self, upstream: str, operation: str, deadline: float):
+        super().__init__(f"{upstream} {operation} did not answer within {deadline:.1f}s")
+        self.upstream = upstream
+
+
+class UpstreamSaturated(UpstreamError):
+    status_code = 503
+
+    def __init__(self, upstream: str, operation: str):
+        super().__init__(f"{upstream} {operation} found no free worker before its deadline")
+        self.upstream = upstream
+
+
+class UpstreamPolicy:
+    def __init__(
+        self,
+        deadline: float,
+        retries: int = 2,
+        hedge_after: Optional[float] = None,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        workers: int = 16,
+    ):
+        self.deadline = deadline
+        self.retries = retries
+        self.hedge_after = hedge_after
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.workers = workers
+
+
+def _env_number(name: str, default, parse=float):
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        return parse(value)
+    except ValueError:
+        print(f"[Python] Ignoring invalid {name}={value!r}")
+        return default
+
+
+def _positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise ValueError(value)
+    return number
+
+
+DEFAULT_WORKERS = _env_number("UPSTREAM_WORKERS", 16, _positive_int)
+
+
+def _policy(upstream: str, deadline: float, hedge_after: Optional[float], **kwargs) -> UpstreamPolicy:
+    prefix = upstream.upper()
+    return UpstreamPolicy(
+        deadline=_env_number(f"{prefix}_DEADLINE_SECONDS", deadline),
+        hedge_after=_env_number(f"{prefix}_HEDGE_AFTER_SECONDS", hedge_after),
+        workers=_env_number(f"{prefix}_WORKERS", DEFAULT_WORKERS, _positive_int),
+        **kwargs,
+    )
+
+
+POLICIES: Dict[str, UpstreamPolicy] = {
+    "gemini": _policy("gemini", deadline=45.0, hedge_after=None, retries=0),
+    # Off by default: a hedged read is billed twice, and the slow reads are the large ones
+    "firestore": _policy("firestore", deadline=10.0, hedge_after=None),
+    "google_calendar": _policy("google_calendar", deadline=20.0, hedge_after=1.5),
+    "google_tasks": _policy("google_tasks", deadline=20.0, hedge_after=1.5),
+}
+DEFAULT_POLICY = UpstreamPolicy(deadline=20.0)
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open probe."""
+
+    def __init__(self, upstream: str, policy: UpstreamPolicy):
+        self.upstream = upstream
+        self.policy = policy
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+        circuit_state.set(upstream, value=0)
+
+    def _transition(self, state: str) -> None:
+        self.state = state
+        circuit_state.set(self.upstream, value=_STATE_VALUES[state])
+        circuit_transitions_total.inc(self.upstream, state)
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.policy.reset_timeout:
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN and not self.probing:
+                # Let exactly one request through to test the upstream
+                self.probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self.lock:
+            self.failures = 0
+            self.probing = False
+            if self.state != CLOSED:
+                self._transition(CLOSED)
+
+    def release(self) -> None:
+        """The call never reached the upstream; give the probe slot back."""
+        with self.lock:
+            self.probing = False
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.policy.failure_threshold):
+                self.opened_at = time.monotonic()
+                self._transition(OPEN)
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+# Calls run on these so a handler can stop waiting at the deadline. Abandoned
+# calls keep their worker until the SDK gives up, so each pool bounds how many
+# can pile up for its own upstream only.
+_pools: Dict[str, ThreadPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+def get_policy(upstream: str) -> UpstreamPolicy:
+    return POLICIES.get(upstream, DEFAULT_POLICY)
+
+
+def get_breaker(upstream: str) -> CircuitBreaker:
+    breaker = _breakers.get(upstream)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(upstream, CircuitBreaker(upstream, get_policy(upstream)))
+    return breaker
+
+
+def get_pool(upstream: str) -> ThreadPoolExecutor:
+    pool = _pools.get(upstream)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(upstream)
+            if pool is None:
+                pool = _pools[upstream] = ThreadPoolExecutor(
+                    max_workers=get_policy(upstream).workers, thread_name_prefix=f"upstream-{upstream}"
+                )
+    return pool
+
+
+def _status(exc: BaseException) -> Optional[int]:
+    # googleapiclient errors carry the response, google.api_core errors an HTTP code
+    status = getattr(getattr(exc, "resp", None), "status", None)
+    if status is None and isinstance(getattr(exc, "code", None), int):
+        status = exc.code
+    return status
+
+
+def _is_upstream_failure(exc: BaseException) -> bool:
+    """Whether an error says something about the upstream's health.
+
+    Answers like 400/404 or an expired token mean the upstream is fine and do
+    not count against the breaker; 429/5xx, timeouts and connection errors do.
+    """
+    if type(exc).__name__ == "RefreshError":
+        return False
+    status = _status(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+    return True
+
+
+def _submit(upstream: str, fn: Callable[[], Any]):
+    ctx = contextvars.copy_context()
+    return get_pool(upstream).submit(ctx.run, fn)
+
+
+def _abandon(upstream: str, operation: str, futures, timeout: float) -> UpstreamError:
+    """Cancel attempts still queued and build the error for the caller.
+
+    Only an attempt that actually reached the upstream makes this a timeout;
+    if all of them were still waiting for a worker, the pool was the problem.
+    """
+    running = [f for f in futures if not f.cancel()]
+    if not running:
+        upstream_saturated_total.inc(upstream, operation)
+        return UpstreamSaturated(upstream, operation)
+    upstream_timeouts_total.inc(upstream, operation)
+    return UpstreamTimeout(upstream, operation, timeout)
+
+
+def _attempt(upstream: str, operation: str, fn: Callable[[], Any], timeout: float, hedge_after: Optional[float]) -> Any:
+    started = time.monotonic()
+    with track_upstream(upstream, operation):
+        first = _submit(upstream, fn)
+        if hedge_after is None or hedge_after >= timeout:
+            try:
+                return first.result(timeout=timeout)
+            except FutureTimeout:
+                raise _abandon(upstream, operation, [first], timeout)
+
+        done, _ = wait([first], timeout=hedge_after)
+        if done:
+            return first.result()
+        if not first.running():
+            # Still queued: a second attempt would only queue behind it
+            try:
+                return first.result(timeout=max(0.0, timeout - (time.monotonic() - started)))
+            except FutureTimeout:
+                raise _abandon(upstream, operation, [first], timeout)
+
+        pending = {first, _submit(upstream, fn)}
+        while pending:
+            remaining = timeout - (time.monotonic() - started)
+            done, pending = wait(pending, timeout=max(0.0, remaining), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            winner = done.pop()
+            # A failed attempt only wins if the other one has failed too
+            if winner.exception() is None or not pending:
+                for loser in pending:
+                    loser.cancel()
+                upstream_hedges_total.inc(upstream, operation, "primary" if winner is first else "hedge")
+                return winner.result()
+
+        upstream_hedges_total.inc(upstream, operation, "none")
+        raise _abandon(upstream, operation, pending, timeout)
+
+
+def guarded(
+    upstream: str,
+    operation: str,
+    fn: Callable[[], Any],
+    idempotent: bool = False,
+    hedge: bool = False,
+) -> Any:
+    """Call ``fn`` under the upstream's deadline and breaker.
+
+    ``idempotent`` enables bounded retries on 429/5xx and timeouts, ``hedge``
+    (only honoured for idempotent calls) enables a hedged second attempt.
+    ``fn`` must be safe to run more than once, concurrently, when either is set.
+    """
+    policy = get_policy(upstream)
+    breaker = get_breaker(upstream)
+    if not breaker.allow():
+        upstream_rejected_total.inc(upstream)
+        raise UpstreamUnavailable(upstream)
+
+    deadline = time.monotonic() + policy.deadline
+    attempts = 1 + (policy.retries if idempotent else 0)
+    hedge_after = policy.hedge_after if hedge and idempotent else None
+
+    for attempt in range(attempts):
+        remaining = deadline - time.monotonic()
+        try:
+            result = _attempt(upstream, operation, fn, remaining, hedge_after)
+        except UpstreamSaturated:
+            # Local queueing says nothing about the upstream's health
+            breaker.release()
+            raise
+        except Exception as exc:
+            failure = isinstance(exc, UpstreamTimeout) or _is_upstream_failure(exc)
+            if not failure:
+                # The upstream answered; the request itself was bad
+                breaker.record_success()
+                raise
+            retry_in = random.uniform(0, 0.2 * (2 ** attempt))
+            if attempt + 1 >= attempts or deadline - time.monotonic() <= retry_in:
+                breaker.record_failure()
+                raise
+            upstream_retries_total.inc(upstream, operation)
+            time.sleep(retry_in)
+            continue
+        breaker.record_success()
+        return result
+
+
+def _fresh_http(credentials, timeout: float):
+    # Each attempt gets its own connection: httplib2 is not thread-safe and an
+    # abandoned attempt may still be using the request's original one
+    import google_auth_httplib2
+    import httplib2
+
+    return google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http(timeout=timeout))
+
+
+def execute(request, upstream: str, operation: str, idempotent: bool = False, hedge: bool = False) -> Any:
+    """``request.execute()`` for googleapiclient requests, through ``guarded``."""
+    credentials = getattr(getattr(request, "http", None), "credentials", None)
+    timeout = get_policy(upstream).deadline
+
+    def run():
+        if credentials is None:
+            return request.execute()
+        return request.execute(http=_fresh_http(credentials, timeout))
+
+    return guarded(upstream, operation, run, idempotent=idempotent, hedge=hedge)
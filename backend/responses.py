@@ -0,0 +1,58 @@
+"""JSON response class used across the routers.
+
+Uses orjson when it is installed and falls back to the standard library.
+Handlers that return large payloads hand their data straight to
+``FastJSONResponse`` so FastAPI's ``jsonable_encoder`` walk is skipped;
+Firestore timestamp types are handled by ``_default`` instead.
+"""
+import base64
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    # Firestore returns DatetimeWithNanoseconds, a datetime subclass orjson won't take as is
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    # Raw protobuf Timestamps
+    if hasattr(obj, "ToDatetime"):
+        return obj.ToDatetime().isoformat()
+    # DocumentReference
+    if hasattr(obj, "path") and hasattr(obj, "id"):
+        return obj.path
+    # GeoPoint
+    if hasattr(obj, "latitude") and hasattr(obj, "longitude"):
+        return {"latitude": obj.latitude, "longitude": obj.longitude}
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, bytes):
+        return base64.b64encode(obj).decode("ascii")
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    if hasattr(obj, "dict"):
+        return obj.dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,26 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-import firebase_admin
-from firebase_admin import credentials, auth
-import os
+from typing import Optional
+from backend.firebase import init_firebase
+from backend.metrics import track_upstream
+from backend.tracing import span
 
 router = APIRouter(tags=["auth"])
 security = HTTPBearer()
-
-# Initialize Firebase Admin
-# We look for serviceAccountKey.json in the backend directory
-cred_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "serviceAccountKey.json")
-
-if not firebase_admin._apps:
-    if os.path.exists(cred_path):
-        try:
-            cred = credentials.Certificate(cred_path)
-            firebase_admin.initialize_app(cred)
-            print("[Python] Firebase Admin initialized successfully")
-        except Exception as e:
-            print(f"[Python] Error initializing Firebase Admin: {e}")
-    else:
-        print(f"[Python] Warning: {cred_path} not found. Firebase features will not work until you add the file.")
+optional_security = HTTPBearer(auto_error=False)
 
 def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     token = credentials.credentials
@@ -28,15 +15,22 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     # If Firebase is not initialized, we can't verify. 
     # For development without credentials, we might want to bypass or fail.
     # Failing is safer.
-    if not firebase_admin._apps:
+    # Firebase Admin is initialized here, on the first authenticated request,
+    # instead of at import time to keep cold starts short.
+    with span("firebase.init"):
+        firebase_ready = init_firebase()
+    if not firebase_ready:
          raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="Firebase not initialized on server",
         )
 
+    from firebase_admin import auth
+
     try:
         # Add 60 seconds leeway for clock skew
-        decoded_token = auth.verify_id_token(token, clock_skew_seconds=60)
+        with track_upstream("firebase_auth", "verify_id_token"):
+            decoded_token = auth.verify_id_token(token, clock_skew_seconds=60)
         return decoded_token
     except Exception as e:
         raise HTTPException(
@@ -45,6 +39,15 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+def optional_user(credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)):
+    # For routes that also serve anonymous callers: no token, or a bad one, is just no user
+    if credentials is None:
+        return None
+    try:
+        return verify_token(credentials)
+    except HTTPException:
+        return None
+
 @router.get("/api/auth/verify")
 def verify_user(user = Depends(verify_token)):
     return {"message": "User verified", "uid": user["uid"], "email": user.get("email")}
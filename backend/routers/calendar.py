@@ -1,15 +1,42 @@
 
 from fastapi import APIRouter, HTTPException, Body, Depends
 from pydantic import BaseModel
-from typing import List, Optional
-from google.oauth2.credentials import Credentials
+from typing import Any, Dict, List, Optional
 from google.auth.exceptions import RefreshError
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from backend.routers.auth import verify_token
+from backend.google_batch import execute_batched, error_status
+from backend.schedule_compiler import compile_schedule, diff_events, fingerprint
+from backend.resilience import UpstreamError, execute, guarded
+from backend.tracing import span
+from backend.responses import FastJSONResponse
+from backend.firebase import get_db
+from backend import jobs
+from backend.intervals import expand_weekly, find_conflicts, free_slots, merge_intervals
+from datetime import date, datetime, time, timedelta
+import hashlib
+from zoneinfo import ZoneInfo
 
 router = APIRouter(tags=["calendar"])
 
+TIME_ZONE = 'America/Sao_Paulo' # Defaulting to BRT as requested by user context
+
+DEFAULT_REMINDERS = {
+    'useDefault': False,
+    'overrides': [
+        {'method': 'popup', 'minutes': 10},
+    ],
+}
+
+def get_service(access_token: str):
+    # Imported here: the discovery client is heavy and only needed once a handler runs
+    from google.oauth2.credentials import Credentials
+    from googleapiclient.discovery import build
+
+    creds = Credentials(token=access_token)
+    with span("discovery.build"):
+        return build('calendar', 'v3', credentials=creds)
+
 class CalendarEvent(BaseModel):
     summary: str
     description: Optional[str] = None
@@ -18,42 +45,39 @@ class CalendarEvent(BaseModel):
     access_token: str
     recurrence: Optional[List[str]] = None
 
+def build_event_body(event: CalendarEvent) -> Dict[str, Any]:
+    event_body = {
+        'summary': event.summary,
+        'description': event.description,
+        'start': {
+            'dateTime': event.start_time,
+            'timeZone': TIME_ZONE,
+        },
+        'end': {
+            'dateTime': event.end_time,
+            'timeZone': TIME_ZONE,
+        },
+        'reminders': DEFAULT_REMINDERS,
+    }
+    if event.recurrence:
+        event_body['recurrence'] = event.recurrence
+    return event_body
+
 @router.post("/create_event")
 def create_event(event: CalendarEvent, user = Depends(verify_token)):
     try:
-        # Create credentials object from access token
-        creds = Credentials(token=event.access_token)
-        
-        service = build('calendar', 'v3', credentials=creds)
-        
-        event_body = {
-            'summary': event.summary,
-            'description': event.description,
-            'start': {
-                'dateTime': event.start_time,
-                'timeZone': 'America/Sao_Paulo', # Defaulting to BRT as requested by user context
-            },
-            'end': {
-                'dateTime': event.end_time,
-                'timeZone': 'America/Sao_Paulo',
-            },
-            'reminders': {
-                'useDefault': False,
-                'overrides': [
-                    {'method': 'popup', 'minutes': 10},
-                ],
-            },
-        }
-
-        if event.recurrence:
-            event_body['recurrence'] = event.recurrence
+        service = get_service(event.access_token)
+        
+        event_body = build_event_body(event)
         
-        created_event = service.events().insert(calendarId='primary', body=event_body).execute()
+        created_event = execute(service.events().insert(calendarId='primary', body=event_body), "google_calendar", "events.insert")
         
         return {"message": "Event created", "eventId": created_event.get('id'), "link": created_event.get('htmlLink')}
         
     except RefreshError:
         raise HTTPException(status_code=401, detail="Google token expired")
+    except UpstreamError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         print(f"Error creating calendar event: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -65,13 +89,14 @@ class DeleteEventRequest(BaseModel):
 @router.post("/delete_event")
 def delete_event(request: DeleteEventRequest, user = Depends(verify_token)):
     try:
-        creds = Credentials(token=request.access_token)
-        service = build('calendar', 'v3', credentials=creds)
+        service = get_service(request.access_token)
         
-        service.events().delete(calendarId='primary', eventId=request.eventId).execute()
+        execute(service.events().delete(calendarId='primary', eventId=request.eventId), "google_calendar", "events.delete", idempotent=True)
         return {"message": "Event deleted"}
     except RefreshError:
         raise HTTPException(status_code=401, detail="Google token expired")
+    except UpstreamError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except HttpError as e:
         if e.resp.status == 410:
             return {"message": "Event already deleted"}
@@ -89,21 +114,22 @@ class ListEventsRequest(BaseModel):
 @router.post("/list_events")
 def list_events(request: ListEventsRequest, user = Depends(verify_token)):
     try:
-        creds = Credentials(token=request.access_token)
-        service = build('calendar', 'v3', credentials=creds)
+        service = get_service(request.access_token)
         
-        events_result = service.events().list(
+        events_result = execute(service.events().list(
             calendarId='primary', 
             timeMin=request.timeMin,
             timeMax=request.timeMax,
             singleEvents=True,
             orderBy='startTime'
-        ).execute()
+        ), "google_calendar", "events.list", idempotent=True, hedge=True)
         
         events = events_result.get('items', [])
-        return {"events": events}
+        return FastJSONResponse({"events": events})
     except RefreshError:
         raise HTTPException(status_code=401, detail="Google token expired")
+    except UpstreamError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         print(f"Error listing events: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -117,91 +143,413 @@ class UpdateEventRequest(BaseModel):
     end_time: Optional[str] = None
     recurrence: Optional[List[str]] = None
 
+def build_patch_body(request) -> Dict[str, Any]:
+    event_body = {}
+    if request.summary is not None:
+        event_body['summary'] = request.summary
+    if request.description is not None:
+        event_body['description'] = request.description
+    if request.start_time:
+        event_body['start'] = {'dateTime': request.start_time, 'timeZone': TIME_ZONE}
+    if request.end_time:
+        event_body['end'] = {'dateTime': request.end_time, 'timeZone': TIME_ZONE}
+    if request.recurrence is not None:
+        event_body['recurrence'] = request.recurrence
+    return event_body
+
 @router.post("/update_event")
 def update_event(request: UpdateEventRequest, user = Depends(verify_token)):
     try:
-        creds = Credentials(token=request.access_token)
-        service = build('calendar', 'v3', credentials=creds)
-        
-        event_body = {}
-        if request.summary is not None:
-            event_body['summary'] = request.summary
-        if request.description is not None:
-            event_body['description'] = request.description
-        if request.start_time:
-            event_body['start'] = {'dateTime': request.start_time, 'timeZone': 'America/Sao_Paulo'}
-        if request.end_time:
-            event_body['end'] = {'dateTime': request.end_time, 'timeZone': 'America/Sao_Paulo'}
-        if request.recurrence is not None:
-            event_body['recurrence'] = request.recurrence
+        service = get_service(request.access_token)
+        
+        event_body = build_patch_body(request)
             
-        updated_event = service.events().patch(calendarId='primary', eventId=request.eventId, body=event_body).execute()
+        updated_event = execute(service.events().patch(calendarId='primary', eventId=request.eventId, body=event_body), "google_calendar", "events.patch", idempotent=True)
         
         return {"message": "Event updated", "eventId": updated_event.get('id'), "link": updated_event.get('htmlLink')}
         
     except RefreshError:
         raise HTTPException(status_code=401, detail="Google token expired")
+    except UpstreamError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         print(f"Error updating calendar event: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+
 class BatchCreateEventsRequest(BaseModel):
     events: List[CalendarEvent]
 
+def job_event_id(job_id: str, index: int) -> str:
+    # Hex digits are valid base32hex, the alphabet Calendar accepts for client-chosen ids
+    return hashlib.sha1(f"{job_id}:{index}".encode()).hexdigest()
+
+def _create_events(events: List[CalendarEvent], offset: int = 0, job_id: Optional[str] = None):
+    # We'll use the first event's token for credentials (assuming all are for same user)
+    access_token = events[0].access_token
+    
+    # Request ids are the event's index in the payload so clients can map results back
+    items = []
+    for i, event in enumerate(events, start=offset):
+        event_body = build_event_body(event)
+        if job_id:
+            # A resumed job re-inserts the same ids, so a replay gets 409 instead of a duplicate
+            event_body['id'] = job_event_id(job_id, i)
+        items.append((str(i), lambda service, body=event_body: service.events().insert(calendarId='primary', body=body)))
+        
+    succeeded, failed = execute_batched(lambda: get_service(access_token), items, upstream="google_calendar")
+    
+    created_events = [
+        {"id": key, "eventId": response.get('id'), "summary": response.get('summary')}
+        for key, response in sorted(succeeded.items(), key=lambda kv: int(kv[0]))
+    ]
+    errors = []
+    for key, error in sorted(failed.items(), key=lambda kv: int(kv[0])):
+        if job_id and error_status(error) == 409:
+            created_events.append({"id": key, "eventId": job_event_id(job_id, int(key)), "summary": None})
+        else:
+            errors.append({"id": key, "error": str(error), "status": error_status(error)})
+    return created_events, errors
+
 @router.post("/create_events_batch")
 def create_events_batch(request: BatchCreateEventsRequest, user = Depends(verify_token)):
     try:
-        # We'll use the first event's token for credentials (assuming all are for same user)
         if not request.events:
             return {"created": [], "errors": []}
+        
+        created_events, errors = _create_events(request.events)
+        return {"created": created_events, "errors": errors}
+        
+    except RefreshError:
+        raise HTTPException(status_code=401, detail="Google token expired")
+    except UpstreamError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        print(f"Error creating batch events: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Events per checkpoint of the background job: a resumed job redoes at most one step
+JOB_STEP_SIZE = 200
+# Error details kept in the checkpoint and result; the rest are only counted
+JOB_MAX_REPORTED_ERRORS = 50
+
+@jobs.register("calendar.create_events_batch")
+def run_create_events_batch(job: jobs.JobContext):
+    # The token is stored once per job; jobs enqueued before that carry it on every event
+    token = job.payload.get("access_token")
+    events = [CalendarEvent(**{"access_token": token, **event}) for event in job.payload["events"]]
+    checkpoint = job.checkpoint or {"next": 0, "created": 0, "failed": 0, "errors": []}
+    
+    for start in range(checkpoint["next"], len(events), JOB_STEP_SIZE):
+        created_events, errors = _create_events(events[start:start + JOB_STEP_SIZE], offset=start, job_id=job.id)
+        checkpoint = {
+            "next": start + JOB_STEP_SIZE,
+            "created": checkpoint["created"] + len(created_events),
+            "failed": checkpoint["failed"] + len(errors),
+            "errors": (checkpoint["errors"] + errors)[:JOB_MAX_REPORTED_ERRORS],
+        }
+        job.progress(min(len(events), checkpoint["next"]), len(events), checkpoint)
+    
+    return {"created": checkpoint["created"], "failed": checkpoint["failed"], "errors": checkpoint["errors"]}
+
+@router.post("/create_events_batch/jobs", status_code=202)
+async def enqueue_create_events_batch(request: BatchCreateEventsRequest, user = Depends(verify_token)):
+    if not request.events:
+        raise HTTPException(status_code=400, detail="No events to create")
+    payload = {
+        "access_token": request.events[0].access_token,
+        "events": [event.dict(exclude={"access_token"}) for event in request.events],
+    }
+    runner = await jobs.ensure_runner()
+    try:
+        job = await runner.enqueue(user["uid"], "calendar.create_events_batch", payload)
+    except jobs.PayloadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return jobs.public_view(job)
+
+class EventPatch(BaseModel):
+    eventId: str
+    summary: Optional[str] = None
+    description: Optional[str] = None
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+    recurrence: Optional[List[str]] = None
+
+class BatchPatchEventsRequest(BaseModel):
+    access_token: str
+    events: List[EventPatch]
+
+@router.post("/patch_events_batch")
+def patch_events_batch(request: BatchPatchEventsRequest, user = Depends(verify_token)):
+    try:
+        # Batch request ids must be unique: a repeated eventId gets one merged patch, later fields winning
+        bodies: Dict[str, Dict[str, Any]] = {}
+        for event in request.events:
+            bodies.setdefault(event.eventId, {}).update(build_patch_body(event))
+        items = [
+            (event_id, lambda service, event_id=event_id, body=body: service.events().patch(calendarId='primary', eventId=event_id, body=body))
+            for event_id, body in bodies.items()
+        ]
             
-        creds = Credentials(token=request.events[0].access_token)
-        service = build('calendar', 'v3', credentials=creds)
+        succeeded, failed = execute_batched(lambda: get_service(request.access_token), items, upstream="google_calendar")
+        
+        updated_events = [
+            {"eventId": event_id, "summary": response.get('summary'), "link": response.get('htmlLink')}
+            for event_id, response in succeeded.items()
+        ]
+        errors = [
+            {"eventId": event_id, "error": str(error), "status": error_status(error)}
+            for event_id, error in failed.items()
+        ]
         
-        created_events = []
+        return {"updated": updated_events, "errors": errors}
+        
+    except RefreshError:
+        raise HTTPException(status_code=401, detail="Google token expired")
+    except UpstreamError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        print(f"Error patching batch events: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+class BatchDeleteEventsRequest(BaseModel):
+    access_token: str
+    eventIds: List[str]
+
+@router.post("/delete_events_batch")
+def delete_events_batch(request: BatchDeleteEventsRequest, user = Depends(verify_token)):
+    try:
+        items = [
+            (event_id, lambda service, event_id=event_id: service.events().delete(calendarId='primary', eventId=event_id))
+            for event_id in dict.fromkeys(request.eventIds)
+        ]
+        
+        succeeded, failed = execute_batched(lambda: get_service(request.access_token), items, upstream="google_calendar")
+        
+        deleted = list(succeeded.keys())
         errors = []
+        for event_id, error in failed.items():
+            # Same as delete_event: an event that is already gone counts as deleted
+            if error_status(error) in (404, 410):
+                deleted.append(event_id)
+            else:
+                errors.append({"eventId": event_id, "error": str(error), "status": error_status(error)})
         
-        # Google Calendar API doesn't have a true "batch create" endpoint that is atomic
-        # We have to iterate or use the batch HTTP request helper
-        # For simplicity and reliability in this context, we'll iterate
-        # Ideally we should use batch_request from googleapiclient
+        return {"deleted": deleted, "errors": errors}
         
-        batch = service.new_batch_http_request()
+    except RefreshError:
+        raise HTTPException(status_code=401, detail="Google token expired")
+    except UpstreamError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        print(f"Error deleting batch events: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+class ScheduleActivity(BaseModel):
+    id: Optional[str] = None
+    title: Optional[str] = None
+    description: Optional[str] = None
+    day_of_week: int = 0
+    start_time: Optional[str] = None # HH:MM
+    end_time: Optional[str] = None # HH:MM
+
+class SyncScheduleRequest(BaseModel):
+    access_token: str
+    schedule_id: str
+    activities: List[ScheduleActivity]
+    start_date: str # YYYY-MM-DD
+    end_date: Optional[str] = None # YYYY-MM-DD
+
+@router.post("/sync_schedule")
+def sync_schedule(request: SyncScheduleRequest, user = Depends(verify_token)):
+    try:
+        with span("firestore.client"):
+            db = get_db()
+        uid = user["uid"]
+        
+        # Keys, event ids and fingerprints of what was pushed on the previous sync
+        state_ref = db.collection("users").document(uid).collection("calendar-sync").document(request.schedule_id)
+        snapshot = guarded("firestore", "get", state_ref.get, idempotent=True, hedge=True)
+        previous = (snapshot.to_dict() or {}).get("events", {}) if snapshot.exists else {}
+        
+        compiled = compile_schedule(
+            [a.dict() for a in request.activities],
+            date.fromisoformat(request.start_date),
+            date.fromisoformat(request.end_date) if request.end_date else None,
+            TIME_ZONE,
+        )
+        for entry in compiled.values():
+            entry["body"]["reminders"] = DEFAULT_REMINDERS
+        
+        to_create, to_patch, to_delete, unchanged = diff_events(compiled, previous)
+        
+        items = []
+        for key in to_create:
+            items.append((key, lambda service, body=compiled[key]["body"]: service.events().insert(calendarId='primary', body=body)))
+        for key in to_patch:
+            items.append((key, lambda service, event_id=previous[key]["eventId"], body=compiled[key]["body"]: service.events().patch(calendarId='primary', eventId=event_id, body=body)))
+        for key in to_delete:
+            items.append((key, lambda service, event_id=previous[key]["eventId"]: service.events().delete(calendarId='primary', eventId=event_id)))
         
-        def callback(request_id, response, exception):
-            if exception:
-                errors.append({"id": request_id, "error": str(exception)})
+        def service_factory():
+            return get_service(request.access_token)
+        
+        succeeded, failed = execute_batched(service_factory, items, upstream="google_calendar")
+        
+        # Events removed by hand in Calendar can't be patched; recreate them
+        gone = [key for key in to_patch if error_status(failed.get(key)) in (404, 410)]
+        if gone:
+            recreated, failed_again = execute_batched(service_factory, [
+                (key, lambda service, body=compiled[key]["body"]: service.events().insert(calendarId='primary', body=body))
+                for key in gone
+            ], upstream="google_calendar")
+            for key in gone:
+                failed.pop(key, None)
+            succeeded.update(recreated)
+            failed.update(failed_again)
+        
+        events_state = {}
+        for key, entry in compiled.items():
+            if key in succeeded:
+                event_id = succeeded[key].get('id')
+            elif key in unchanged or (key in failed and key in previous):
+                # Keep the old entry so a failed patch is retried on the next sync
+                events_state[key] = previous[key]
+                continue
             else:
-                created_events.append({"id": request_id, "eventId": response.get('id'), "summary": response.get('summary')})
-
-        for i, event in enumerate(request.events):
-            event_body = {
-                'summary': event.summary,
-                'description': event.description,
-                'start': {
-                    'dateTime': event.start_time,
-                    'timeZone': 'America/Sao_Paulo',
-                },
-                'end': {
-                    'dateTime': event.end_time,
-                    'timeZone': 'America/Sao_Paulo',
-                },
-                'reminders': {
-                    'useDefault': False,
-                    'overrides': [{'method': 'popup', 'minutes': 10}],
-                },
+                continue
+            events_state[key] = {
+                "eventId": event_id,
+                "hash": fingerprint(entry["body"]),
+                "title": entry["title"],
+                "days": entry["days"],
+                "start_time": entry["start_time"],
+                "end_time": entry["end_time"],
             }
-            if event.recurrence:
-                event_body['recurrence'] = event.recurrence
-                
-            batch.add(service.events().insert(calendarId='primary', body=event_body), callback=callback)
-            
-        batch.execute()
+        for key in to_delete:
+            if key in failed and error_status(failed[key]) not in (404, 410):
+                events_state[key] = previous[key]
         
-        return {"created": created_events, "errors": errors}
+        guarded("firestore", "set", lambda: state_ref.set({"events": events_state}), idempotent=True)
+        
+        activity_events = {}
+        for key, entry in compiled.items():
+            if key in events_state:
+                for activity_id in entry["activityIds"]:
+                    activity_events[activity_id] = events_state[key]["eventId"]
+        
+        errors = [
+            {"key": key, "error": str(error), "status": error_status(error)}
+            for key, error in failed.items()
+            if not (key in to_delete and error_status(error) in (404, 410))
+        ]
+        
+        return {
+            "created": [key for key in to_create + gone if key in succeeded],
+            "updated": [key for key in to_patch if key in succeeded and key not in gone],
+            "deleted": [key for key in to_delete if key not in events_state],
+            "unchanged": unchanged,
+            "activityEvents": activity_events,
+            "errors": errors,
+        }
         
     except RefreshError:
         raise HTTPException(status_code=401, detail="Google token expired")
+    except UpstreamError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        print(f"Error creating batch events: {e}")
+        print(f"Error syncing schedule: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+class AvailabilityRequest(BaseModel):
+    access_token: str
+    timeMin: str # ISO format
+    timeMax: str # ISO format
+    activities: List[ScheduleActivity] = []
+    duration_minutes: int = 60
+    limit: int = 5
+    day_start: str = "08:00" # HH:MM, only look for free slots inside this daily window
+    day_end: str = "22:00"
+    calendar_ids: List[str] = ['primary']
+
+def _iso(timestamp: float, tz) -> str:
+    return datetime.fromtimestamp(timestamp, tz).isoformat()
+
+@router.post("/availability")
+def availability(request: AvailabilityRequest, user = Depends(verify_token)):
+    try:
+        if request.duration_minutes <= 0:
+            raise ValueError("duration_minutes must be positive")
+        if request.limit <= 0:
+            raise ValueError("limit must be positive")
+        
+        tz = ZoneInfo(TIME_ZONE)
+        window_start = datetime.fromisoformat(request.timeMin)
+        window_end = datetime.fromisoformat(request.timeMax)
+        if window_start.tzinfo is None:
+            window_start = window_start.replace(tzinfo=tz)
+        if window_end.tzinfo is None:
+            window_end = window_end.replace(tzinfo=tz)
+        
+        service = get_service(request.access_token)
+        freebusy = execute(service.freebusy().query(body={
+            'timeMin': window_start.isoformat(),
+            'timeMax': window_end.isoformat(),
+            'timeZone': TIME_ZONE,
+            'items': [{'id': calendar_id} for calendar_id in request.calendar_ids],
+        }), "google_calendar", "freebusy.query", idempotent=True, hedge=True)
+        
+        busy = []
+        for calendar_id, calendar in freebusy.get('calendars', {}).items():
+            for block in calendar.get('busy', []):
+                busy.append((
+                    datetime.fromisoformat(block['start']).timestamp(),
+                    datetime.fromisoformat(block['end']).timestamp(),
+                    {"calendarId": calendar_id},
+                ))
+        
+        occurrences = expand_weekly([a.dict() for a in request.activities], window_start, window_end, tz)
+        
+        conflicts = []
+        for activity, other in find_conflicts(occurrences, busy):
+            conflicts.append({
+                "activity": activity[2],
+                "start": _iso(activity[0], tz),
+                "end": _iso(activity[1], tz),
+                "conflictsWith": "activity" if "title" in other[2] else "busy",
+                "other": other[2],
+                "otherStart": _iso(other[0], tz),
+                "otherEnd": _iso(other[1], tz),
+            })
+        
+        slots = free_slots(
+            merge_intervals(busy + occurrences),
+            window_start,
+            window_end,
+            timedelta(minutes=request.duration_minutes),
+            tz,
+            time.fromisoformat(request.day_start),
+            time.fromisoformat(request.day_end),
+            limit=request.limit,
+        )
+        
+        return {
+            "conflicts": conflicts,
+            "freeSlots": [
+                {"start": _iso(start, tz), "end": _iso(end, tz), "gapEnd": _iso(gap_end, tz)}
+                for start, end, gap_end in slots
+            ],
+            "busyCount": len(busy),
+        }
+        
+    except RefreshError:
+        raise HTTPException(status_code=401, detail="Google token expired")
+    except UpstreamError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Error checking availability: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,112 @@
+import asyncio
+from fastapi import APIRouter, HTTPException, Depends
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+from backend.routers.auth import verify_token
+from backend.firebase import get_db
+from backend.resilience import UpstreamError
+from backend import conversations
+
+router = APIRouter(tags=["conversations"])
+
+class ImportedConversation(BaseModel):
+    id: str
+    messages: List[Dict[str, Any]] = []
+
+class ImportConversationsRequest(BaseModel):
+    conversations: List[ImportedConversation]
+
+def _check_id(conversation_id: str):
+    if not conversations.valid_conversation_id(conversation_id):
+        raise HTTPException(status_code=400, detail="Invalid conversation id")
+
+@router.get("/")
+def list_conversations(before: Optional[str] = None, limit: int = 20, user = Depends(verify_token)):
+    try:
+        items, next_cursor = conversations.list_conversations(get_db(), user["uid"], before, max(1, min(limit, 100)))
+        return {"conversations": items, "nextCursor": next_cursor}
+    except UpstreamError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        print(f"Error listing conversations: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/{conversation_id}/turns")
+def list_turns(conversation_id: str, before: Optional[int] = None, limit: int = 50, user = Depends(verify_token)):
+    try:
+        _check_id(conversation_id)
+        db = get_db()
+        meta = conversations.get_conversation(db, user["uid"], conversation_id)
+        if meta is None:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        
+        turns, next_cursor = conversations.list_turns(db, user["uid"], conversation_id, before, max(1, min(limit, 200)))
+        return {
+            "conversation": conversations.conversation_view(conversation_id, meta),
+            "turns": [conversations.turn_view(turn) for turn in turns],
+            "nextCursor": next_cursor,
+        }
+    except HTTPException:
+        raise
+    except UpstreamError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        print(f"Error listing conversation turns: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/{conversation_id}")
+def delete_conversation(conversation_id: str, user = Depends(verify_token)):
+    try:
+        _check_id(conversation_id)
+        conversations.delete_conversation(get_db(), user["uid"], conversation_id)
+        return {"message": "Deleted", "id": conversation_id}
+    except HTTPException:
+        raise
+    except UpstreamError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        print(f"Error deleting conversation: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/import")
+async def import_conversations(request: ImportConversationsRequest, user = Depends(verify_token)):
+    # One-time move of the old `chat-conversations` blob. Conversations that
+    # already exist server-side are left alone, and an import interrupted
+    # between chunks resumes where it stopped, so retrying is safe
+    try:
+        db = get_db()
+        imported, skipped, partial = [], [], []
+        for conversation in request.conversations:
+            _check_id(conversation.id)
+            turns = [
+                {"role": "user" if m.get("role") == "user" else "assistant", "content": m.get("content")}
+                for m in conversation.messages
+                if isinstance(m.get("content"), str) and m["content"].strip()
+            ]
+            existing = await asyncio.to_thread(conversations.get_conversation, db, user["uid"], conversation.id)
+            done = conversations.import_progress(existing)
+            if (existing is not None and done is None) or not turns:
+                skipped.append(conversation.id)
+                continue
+            done = done or 0
+
+            try:
+                # Long conversations don't fit in one transaction
+                while done < len(turns):
+                    chunk = turns[done:done + conversations.MAX_TURNS_PER_APPEND]
+                    await asyncio.to_thread(conversations.append_turns, db, user["uid"], conversation.id, chunk, len(turns))
+                    done += len(chunk)
+            except Exception as e:
+                print(f"Error importing conversation {conversation.id}: {e}")
+                # Retrying the import picks up from here
+                partial.append({"id": conversation.id, "importedTurns": done, "totalTurns": len(turns), "error": str(e)})
+                continue
+            imported.append(conversation.id)
+        return {"imported": imported, "skipped": skipped, "partial": partial}
+    except HTTPException:
+        raise
+    except UpstreamError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        print(f"Error importing conversations: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,6 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, Body
 from backend.routers.auth import verify_token
-from firebase_admin import firestore
+from backend.tasks_sync import GOALS_COLLECTION, now_iso, record_tombstone
+from backend.resilience import UpstreamError, guarded
+from backend.tracing import span
+from backend.responses import FastJSONResponse
+from backend.firebase import get_db
+from backend import search
 from pydantic import BaseModel
 from typing import Dict, Any, List, Optional
 
@@ -13,11 +18,13 @@ class DataItem(BaseModel):
 @router.get("/{collection}")
 def get_data(collection: str, user = Depends(verify_token)):
     try:
-        db = firestore.client()
+        with span("firestore.client"):
+            db = get_db()
         uid = user["uid"]
         
         # Fetch all documents in the user's sub-collection
-        docs = db.collection("users").document(uid).collection(collection).stream()
+        query = db.collection("users").document(uid).collection(collection)
+        docs = guarded("firestore", "stream", lambda: list(query.stream()), idempotent=True, hedge=True)
         
         results = []
         for doc in docs:
@@ -25,8 +32,11 @@ def get_data(collection: str, user = Depends(verify_token)):
             # Ensure ID is included
             data["id"] = doc.id
             results.append(data)
-            
-        return results
+        
+        # Returned as a response so FastAPI skips the jsonable_encoder walk
+        return FastJSONResponse(results)
+    except UpstreamError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         print(f"Error getting data: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -34,23 +44,33 @@ def get_data(collection: str, user = Depends(verify_token)):
 @router.post("/{collection}")
 def save_data(collection: str, item: Dict[str, Any] = Body(...), user = Depends(verify_token)):
     try:
-        db = firestore.client()
+        with span("firestore.client"):
+            db = get_db()
         uid = user["uid"]
         
         # Check if item has an ID
         doc_id = item.get("id")
         
+        if collection == GOALS_COLLECTION:
+            # Version used by the Google Tasks sync to pull only changed goals
+            item["updated_at"] = now_iso()
+        
         if not doc_id:
             # Create new document
             doc_ref = db.collection("users").document(uid).collection(collection).document()
             item["id"] = doc_ref.id
-            doc_ref.set(item)
+            guarded("firestore", "set", lambda: doc_ref.set(item), idempotent=True)
+            search.index_document(uid, collection, doc_ref.id, item)
             return {"message": "Created", "id": doc_ref.id, "data": item}
         else:
             # Update existing document
-            db.collection("users").document(uid).collection(collection).document(doc_id).set(item)
+            doc_ref = db.collection("users").document(uid).collection(collection).document(doc_id)
+            guarded("firestore", "set", lambda: doc_ref.set(item), idempotent=True)
+            search.index_document(uid, collection, doc_id, item)
             return {"message": "Updated", "id": doc_id, "data": item}
             
+    except UpstreamError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         print(f"Error saving data: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -58,11 +78,18 @@ def save_data(collection: str, item: Dict[str, Any] = Body(...), user = Depends(
 @router.delete("/{collection}/{doc_id}")
 def delete_data(collection: str, doc_id: str, user = Depends(verify_token)):
     try:
-        db = firestore.client()
+        with span("firestore.client"):
+            db = get_db()
         uid = user["uid"]
         
-        db.collection("users").document(uid).collection(collection).document(doc_id).delete()
+        doc_ref = db.collection("users").document(uid).collection(collection).document(doc_id)
+        guarded("firestore", "delete", doc_ref.delete, idempotent=True)
+        if collection == GOALS_COLLECTION:
+            guarded("firestore", "set", lambda: record_tombstone(db, uid, doc_id), idempotent=True)
+        search.remove_document(uid, collection, doc_id)
         return {"message": "Deleted", "id": doc_id}
+    except UpstreamError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         print(f"Error deleting data: {e}")
         raise HTTPException(status_code=500, detail=str(e))
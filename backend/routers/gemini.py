@@ -1,18 +1,46 @@
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Request, Depends
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
+import asyncio
 import os
-import google.generativeai as genai
-from dotenv import load_dotenv
-
-load_dotenv()
+import threading
+from backend.resilience import UpstreamError, guarded
+from backend.tracing import span
+from backend.routers.auth import optional_user
+from backend.firebase import get_db
+from backend import search, conversations
 
 router = APIRouter(tags=["chat"])
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+# Notes, kanban cards and schedules matching the message, added to the system prompt
+RETRIEVAL_LIMIT = 5
+# Turns of a stored conversation sent to the model as history
+HISTORY_TURNS = 20
+SEARCH_LABELS = {"notes": "Nota", "kanban-tasks": "Kanban", "schedules": "Cronograma"}
+
+_genai = None
+_genai_lock = threading.Lock()
+
+def get_genai():
+    # google.generativeai (grpc + protobuf) is the slowest import in the app, so it
+    # is loaded and configured on the first chat request instead of at startup
+    global _genai
+    if _genai is None:
+        with _genai_lock:
+            if _genai is None:
+                import google.generativeai as genai
+                api_key = os.getenv("GEMINI_API_KEY")
+                if api_key:
+                    genai.configure(api_key=api_key)
+                _genai = genai
+    return _genai
+
+def build_model(system_instruction: str):
+    return get_genai().GenerativeModel(
+        model_name="gemini-2.0-flash-exp", # Using latest flash model
+        system_instruction=system_instruction,
+        tools=tools
+    )
 
 # Definição das ferramentas (Tools)
 tools = [
@@ -337,53 +365,86 @@ Você é um parceiro de trabalho e estudo. Seja proativo, motivador e extremamen
 
 class ChatRequest(BaseModel):
     message: str
+    conversationId: Optional[str] = None # Stored server-side; when set, conversationHistory is ignored
     conversationHistory: List[Dict[str, Any]] = []
     context: Optional[Dict[str, Any]] = None
     image: Optional[Dict[str, Any]] = None
 
+def build_system_instruction(context: Optional[Dict[str, Any]], related: List[Dict[str, Any]]) -> str:
+    dynamic_system_instruction = system_instruction
+
+    if context:
+        tasks_list = "Nenhuma meta cadastrada."
+        if context.get("tasks"):
+            tasks_list = "\n".join([f"- {'✅' if t.get('completed') else '⏳'} {t.get('title')}" for t in context["tasks"]])
+
+        kanban_list = "Nenhum item no Kanban."
+        if context.get("kanbanTasks"):
+            kanban_list = "\n".join([
+                f"- {k.get('title')} ({'A Fazer' if k.get('column') == 'todo' else 'Em Progresso' if k.get('column') == 'in-progress' else 'Concluído'})"
+                for k in context["kanbanTasks"]
+            ])
+
+        schedules_list = "Nenhum cronograma cadastrado."
+        if context.get("schedules"):
+            schedules_list = "\n".join([
+                f"- {s.get('title')} ({len(s.get('activities', []))} atividades)"
+                for s in context["schedules"]
+            ])
+
+        dynamic_system_instruction += f"\n\n📊 CONTEXTO ATUAL DO USUÁRIO:\n\n**METAS ATUAIS:**\n{tasks_list}\n\n**ITEMS NO KANBAN:**\n{kanban_list}\n\n**CRONOGRAMAS ATUAIS:**\n{schedules_list}"
+
+    if related:
+        related_list = "\n".join([
+            f"- [{SEARCH_LABELS.get(r['collection'], r['collection'])}] {r['title'] or 'Sem título'}: {r['snippet']}"
+            for r in related
+        ])
+        dynamic_system_instruction += f"\n\n🔎 **CONTEÚDO DO USUÁRIO RELACIONADO À MENSAGEM:**\n{related_list}"
+
+    return dynamic_system_instruction
+
+def retrieve_related(uid: str, message: str) -> List[Dict[str, Any]]:
+    # Retrieval is a nice-to-have; the chat must still answer if the index can't be loaded
+    try:
+        return search.search(uid, message, get_db, limit=RETRIEVAL_LIMIT)
+    except Exception as e:
+        print(f"[Python] Skipping retrieval for chat context: {e}")
+        return []
+
 @router.post("/")
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, user = Depends(optional_user)):
     try:
         print("[Python] API /api/chat called")
         
-        if not GEMINI_API_KEY:
+        if not os.getenv("GEMINI_API_KEY"):
             raise HTTPException(status_code=500, detail="GEMINI_API_KEY not configured")
 
-        # Build context
-        dynamic_system_instruction = system_instruction
-
-        if request.context:
-            tasks_list = "Nenhuma meta cadastrada."
-            if request.context.get("tasks"):
-                tasks_list = "\n".join([f"- {'✅' if t.get('completed') else '⏳'} {t.get('title')}" for t in request.context["tasks"]])
-
-            kanban_list = "Nenhum item no Kanban."
-            if request.context.get("kanbanTasks"):
-                kanban_list = "\n".join([
-                    f"- {k.get('title')} ({'A Fazer' if k.get('column') == 'todo' else 'Em Progresso' if k.get('column') == 'in-progress' else 'Concluído'})"
-                    for k in request.context["kanbanTasks"]
-                ])
+        conversation_history = request.conversationHistory
+        if request.conversationId:
+            if not user:
+                raise HTTPException(status_code=401, detail="Stored conversations require authentication")
+            if not conversations.valid_conversation_id(request.conversationId):
+                raise HTTPException(status_code=400, detail="Invalid conversation id")
+            db = get_db()
+            conversation_history = await asyncio.to_thread(
+                conversations.recent_turns, db, user["uid"], request.conversationId, HISTORY_TURNS
+            )
 
-            schedules_list = "Nenhum cronograma cadastrado."
-            if request.context.get("schedules"):
-                schedules_list = "\n".join([
-                    f"- {s.get('title')} ({len(s.get('activities', []))} atividades)"
-                    for s in request.context["schedules"]
-                ])
-
-            dynamic_system_instruction += f"\n\n📊 CONTEXTO ATUAL DO USUÁRIO:\n\n**METAS ATUAIS:**\n{tasks_list}\n\n**ITEMS NO KANBAN:**\n{kanban_list}\n\n**CRONOGRAMAS ATUAIS:**\n{schedules_list}"
+        # Build context
+        related = []
+        if user:
+            related = await asyncio.to_thread(retrieve_related, user["uid"], request.message)
+        dynamic_system_instruction = build_system_instruction(request.context, related)
 
-        model = genai.GenerativeModel(
-            model_name="gemini-2.0-flash-exp", # Using latest flash model
-            system_instruction=dynamic_system_instruction,
-            tools=tools
-        )
+        with span("gemini.model_init"):
+            # Off the event loop: the first call pays for the deferred SDK import
+            model = await asyncio.to_thread(build_model, dynamic_system_instruction)
 
         # Build history
         history = []
         last_role = None
 
-        for msg in request.conversationHistory:
+        for msg in conversation_history:
             role = "user" if msg.get("role") == "user" else "model"
             
             # Skip if same role as last message
@@ -413,7 +474,11 @@ async def chat(request: ChatRequest):
         user_parts = [{"text": request.message}]
         # TODO: Handle image if present (needs decoding base64 if sent as data)
         
-        response = chat_session.send_message(user_parts)
+        # Off the event loop: send_message blocks for the whole generation.
+        # Not idempotent (the session appends to its history), so never retried
+        response = await asyncio.to_thread(
+            guarded, "gemini", "send_message", lambda: chat_session.send_message(user_parts)
+        )
         
         # Process response and function calls
         text_response = ""
@@ -512,11 +577,32 @@ async def chat(request: ChatRequest):
         elif not text_response.strip() and not actions:
             text_response = "Desculpe, não entendi. Poderia repetir?"
 
-        return {
+        result = {
             "message": text_response,
             "actions": actions
         }
 
+        if request.conversationId:
+            result["conversationId"] = request.conversationId
+            try:
+                appended = await asyncio.to_thread(conversations.append_turns, db, user["uid"], request.conversationId, [
+                    {"role": "user", "content": request.message},
+                    {"role": "assistant", "content": text_response, "actions": actions},
+                ])
+                result["turns"] = [conversations.turn_view(turn) for turn in appended]
+            except Exception as e:
+                # The model already answered (and may have acted); don't lose the reply
+                print(f"[Python] Error saving conversation turns: {e}")
+                result["turns"] = []
+                result["unsaved"] = True
+
+        return result
+
+    except HTTPException:
+        raise
+    except UpstreamError as e:
+        print(f"[Python] Gemini unavailable: {e}")
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         print(f"[Python] Error in /api/chat: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,20 @@
+import asyncio
+from fastapi import APIRouter, HTTPException, Depends
+from backend.routers.auth import verify_token
+from backend import jobs
+
+router = APIRouter(tags=["jobs"])
+
+@router.get("/")
+async def list_jobs(limit: int = 20, user = Depends(verify_token)):
+    runner = await jobs.ensure_runner()
+    recent = await asyncio.to_thread(runner.store.list, user["uid"], max(1, min(limit, 100)))
+    return {"jobs": [jobs.public_view(job) for job in recent]}
+
+@router.get("/{job_id}")
+async def get_job(job_id: str, user = Depends(verify_token)):
+    runner = await jobs.ensure_runner()
+    job = await asyncio.to_thread(runner.store.get, user["uid"], job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return jobs.public_view(job)
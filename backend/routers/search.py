@@ -0,0 +1,26 @@
+from fastapi import APIRouter, HTTPException, Depends
+from typing import Optional
+from backend.routers.auth import verify_token
+from backend.firebase import get_db
+from backend.resilience import UpstreamError
+from backend import search as search_index
+
+router = APIRouter(tags=["search"])
+
+@router.get("/")
+def search(q: str, limit: int = 10, collections: Optional[str] = None, user = Depends(verify_token)):
+    try:
+        # e.g. ?collections=notes,kanban-tasks; defaults to everything indexed
+        selected = [c for c in collections.split(",") if c] if collections else None
+        if selected and not set(selected) <= set(search_index.SEARCH_COLLECTIONS):
+            raise HTTPException(status_code=400, detail=f"Searchable collections: {', '.join(search_index.SEARCH_COLLECTIONS)}")
+        
+        results = search_index.search(user["uid"], q, get_db, limit=max(1, min(limit, 50)), collections=selected)
+        return {"query": q, "results": results}
+    except HTTPException:
+        raise
+    except UpstreamError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        print(f"Error searching: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,46 @@
+from fastapi import APIRouter, HTTPException, Depends
+from pydantic import BaseModel
+from backend.firebase import get_db
+from google.auth.exceptions import RefreshError
+from backend.routers.auth import verify_token
+from backend.routers.tasks import get_service
+from backend.tasks_sync import TasksSync
+from backend.tracing import span
+from backend import jobs
+
+router = APIRouter(tags=["sync"])
+
+class SyncTasksRequest(BaseModel):
+    access_token: str
+    tasklist: str = '@default'
+
+@router.post("/tasks")
+def sync_tasks(request: SyncTasksRequest, user = Depends(verify_token)):
+    try:
+        with span("firestore.client"):
+            db = get_db()
+        engine = TasksSync(db, user["uid"], request.tasklist, lambda: get_service(request.access_token))
+        return engine.run()
+    except RefreshError:
+        raise HTTPException(status_code=401, detail="Google token expired")
+    except Exception as e:
+        print(f"Error syncing goals with Google Tasks: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@jobs.register("sync.tasks")
+def run_sync_tasks(job: jobs.JobContext):
+    # A sync is safe to rerun: cursors and mappings are only saved at the end
+    job.progress(0, 1)
+    engine = TasksSync(get_db(), job.uid, job.payload["tasklist"], lambda: get_service(job.payload["access_token"]))
+    result = engine.run()
+    job.progress(1, 1)
+    return result
+
+@router.post("/tasks/jobs", status_code=202)
+async def enqueue_sync_tasks(request: SyncTasksRequest, user = Depends(verify_token)):
+    runner = await jobs.ensure_runner()
+    try:
+        job = await runner.enqueue(user["uid"], "sync.tasks", request.dict())
+    except jobs.PayloadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return jobs.public_view(job)
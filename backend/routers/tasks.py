@@ -1,13 +1,27 @@
-from fastapi import APIRouter, HTTPException, Body
+from fastapi import APIRouter, HTTPException, Body, Depends
 from pydantic import BaseModel
-from typing import List, Optional
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from typing import Any, Dict, List, Optional, Tuple
 from google.auth.exceptions import RefreshError
+from backend.routers.auth import verify_token
+from backend.google_batch import execute_batched, error_status
+from backend.resilience import UpstreamError, execute
+from backend.tracing import span
+from backend.responses import FastJSONResponse
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+import asyncio
+import threading
 import os
 
 router = APIRouter()
 
+# Per-user, per-list cache used for `updatedMin` incremental fetches.
+# It lives in process memory, so a cold instance just does a full fetch.
+MAX_CACHED_LISTS = 512
+CACHE_SKEW = timedelta(seconds=60)
+_task_cache: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
 class TaskItem(BaseModel):
     title: str
     notes: Optional[str] = None
@@ -21,17 +35,26 @@ class DeleteTaskRequest(BaseModel):
 
 class ListTasksRequest(BaseModel):
     access_token: str
+    tasklist: str = '@default'
+    all_lists: bool = False # Fetch every list from tasklists().list() instead of `tasklist`
+    full_refresh: bool = False # Ignore the cache and refetch everything
 
 class UpdateTaskRequest(BaseModel):
     task_id: str
     access_token: str
+    tasklist: str = '@default'
     title: Optional[str] = None
     notes: Optional[str] = None
     status: Optional[str] = None # "needsAction" or "completed"
 
 def get_service(access_token: str):
+    # Imported here: the discovery client is heavy and only needed once a handler runs
+    from google.oauth2.credentials import Credentials
+    from googleapiclient.discovery import build
+
     creds = Credentials(token=access_token)
-    return build('tasks', 'v1', credentials=creds)
+    with span("discovery.build"):
+        return build('tasks', 'v1', credentials=creds)
 
 @router.post("/create_task")
 async def create_task(task: TaskItem):
@@ -48,10 +71,14 @@ async def create_task(task: TaskItem):
             task_body['due'] = task.due
 
         # Use the default task list ('@default')
-        result = service.tasks().insert(tasklist='@default', body=task_body).execute()
+        result = await asyncio.to_thread(
+            execute, service.tasks().insert(tasklist='@default', body=task_body), "google_tasks", "tasks.insert"
+        )
         return {"taskId": result.get('id'), "status": "success"}
     except RefreshError:
         raise HTTPException(status_code=401, detail="Google token expired")
+    except UpstreamError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         print(f"Error creating task: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -60,49 +87,208 @@ async def create_task(task: TaskItem):
 async def delete_task(request: DeleteTaskRequest):
     try:
         service = get_service(request.access_token)
-        service.tasks().delete(tasklist='@default', task=request.task_id).execute()
+        await asyncio.to_thread(
+            execute, service.tasks().delete(tasklist='@default', task=request.task_id), "google_tasks", "tasks.delete", idempotent=True
+        )
         return {"status": "success"}
     except RefreshError:
         raise HTTPException(status_code=401, detail="Google token expired")
+    except UpstreamError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         print(f"Error deleting task: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _fetch_tasks(access_token: str, tasklist: str, updated_min: Optional[str]) -> List[Dict[str, Any]]:
+    # Runs in a worker thread; httplib2 is not thread-safe so each fetch builds its own service
+    service = get_service(access_token)
+    items = []
+    page_token = None
+    while True:
+        params = {
+            'tasklist': tasklist,
+            'showCompleted': True,
+            'showHidden': True,
+            'maxResults': 100,
+        }
+        if updated_min:
+            # Deleted tasks are only reported when asked for, and we need them to prune the cache
+            params['updatedMin'] = updated_min
+            params['showDeleted'] = True
+        if page_token:
+            params['pageToken'] = page_token
+        results = execute(service.tasks().list(**params), "google_tasks", "tasks.list", idempotent=True, hedge=True)
+        items.extend(results.get('items', []))
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return items
+
+def _fetch_tasklists(access_token: str) -> List[Dict[str, Any]]:
+    service = get_service(access_token)
+    lists = []
+    page_token = None
+    while True:
+        results = execute(service.tasklists().list(maxResults=100, pageToken=page_token), "google_tasks", "tasklists.list", idempotent=True, hedge=True)
+        lists.extend(results.get('items', []))
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return lists
+
+def _sync_tasklist(uid: str, access_token: str, tasklist: str, full_refresh: bool) -> List[Dict[str, Any]]:
+    cache_key = (uid, tasklist)
+    with _cache_lock:
+        cached = _task_cache.get(cache_key)
+        if cached:
+            _task_cache.move_to_end(cache_key)
+
+    # Tasks' `updated` is Google's clock, so step back a little to cover skew
+    synced_at = (datetime.now(timezone.utc) - CACHE_SKEW).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+    if cached and not full_refresh:
+        tasks = dict(cached['tasks'])
+        for task in _fetch_tasks(access_token, tasklist, cached['synced_at']):
+            if task.get('deleted'):
+                tasks.pop(task['id'], None)
+            else:
+                tasks[task['id']] = task
+    else:
+        tasks = {task['id']: task for task in _fetch_tasks(access_token, tasklist, None)}
+
+    with _cache_lock:
+        _task_cache[cache_key] = {'synced_at': synced_at, 'tasks': tasks}
+        _task_cache.move_to_end(cache_key)
+        while len(_task_cache) > MAX_CACHED_LISTS:
+            _task_cache.popitem(last=False)
+
+    return sorted(tasks.values(), key=lambda t: (t.get('parent') or '', t.get('position') or ''))
+
 @router.post("/list_tasks")
-async def list_tasks(request: ListTasksRequest):
+async def list_tasks(request: ListTasksRequest, user = Depends(verify_token)):
     try:
-        service = get_service(request.access_token)
-        results = service.tasks().list(tasklist='@default', showCompleted=True, showHidden=True).execute()
-        items = results.get('items', [])
-        return {"tasks": items}
-    except Exception as e:
-        print(f"Error listing tasks: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        uid = user["uid"]
+        
+        if request.all_lists:
+            tasklists = await asyncio.to_thread(_fetch_tasklists, request.access_token)
+        else:
+            tasklists = [{'id': request.tasklist}]
+        
+        # One thread per list so large accounts cost a single round trip of wall time
+        results = await asyncio.gather(*[
+            asyncio.to_thread(_sync_tasklist, uid, request.access_token, tl['id'], request.full_refresh)
+            for tl in tasklists
+        ])
+        
+        response = {"tasks": [task for items in results for task in items]}
+        if request.all_lists:
+            response["lists"] = [
+                {"id": tl['id'], "title": tl.get('title'), "tasks": items}
+                for tl, items in zip(tasklists, results)
+            ]
+        return FastJSONResponse(response)
     except RefreshError:
         raise HTTPException(status_code=401, detail="Google token expired")
+    except UpstreamError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         print(f"Error listing tasks: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def build_patch_body(request) -> Dict[str, Any]:
+    body = {}
+    # An empty title is never meant to blank the task
+    if request.title:
+        body['title'] = request.title
+    if request.notes is not None:
+        body['notes'] = request.notes
+    if getattr(request, 'due', None) is not None:
+        body['due'] = request.due
+    if request.status is not None:
+        body['status'] = request.status
+        if request.status == 'needsAction':
+            # Reopening a task has to clear its completion date too
+            body['completed'] = None
+    return body
+
 @router.post("/update_task")
 async def update_task(request: UpdateTaskRequest):
     try:
         service = get_service(request.access_token)
         
-        # First get the task to preserve other fields
-        task = service.tasks().get(tasklist='@default', task=request.task_id).execute()
-        
-        if request.title:
-            task['title'] = request.title
-        if request.notes:
-            task['notes'] = request.notes
-        if request.status:
-            task['status'] = request.status
-            
-        updated_task = service.tasks().update(tasklist='@default', task=request.task_id, body=task).execute()
+        # patch only sends the changed fields, so there's no need to get the task first
+        body = build_patch_body(request)
+        updated_task = await asyncio.to_thread(
+            execute, service.tasks().patch(tasklist=request.tasklist, task=request.task_id, body=body), "google_tasks", "tasks.patch", idempotent=True
+        )
         return {"status": "success", "task": updated_task}
     except RefreshError:
         raise HTTPException(status_code=401, detail="Google token expired")
+    except UpstreamError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         print(f"Error updating task: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+class BulkTaskOperation(BaseModel):
+    op: str # "create", "patch" or "delete"
+    task_id: Optional[str] = None # required for patch and delete
+    tasklist: str = '@default'
+    title: Optional[str] = None
+    notes: Optional[str] = None
+    due: Optional[str] = None # RFC 3339 timestamp
+    status: Optional[str] = None # "needsAction" or "completed"
+
+class BulkTasksRequest(BaseModel):
+    access_token: str
+    operations: List[BulkTaskOperation]
+
+def _bulk_request(operation: BulkTaskOperation):
+    if operation.op == 'create':
+        body = build_patch_body(operation)
+        return lambda service: service.tasks().insert(tasklist=operation.tasklist, body=body)
+    if not operation.task_id:
+        raise HTTPException(status_code=400, detail=f"task_id is required for {operation.op}")
+    if operation.op == 'patch':
+        body = build_patch_body(operation)
+        return lambda service: service.tasks().patch(tasklist=operation.tasklist, task=operation.task_id, body=body)
+    if operation.op == 'delete':
+        return lambda service: service.tasks().delete(tasklist=operation.tasklist, task=operation.task_id)
+    raise HTTPException(status_code=400, detail=f"Unknown operation: {operation.op}")
+
+@router.post("/bulk")
+async def bulk_tasks(request: BulkTasksRequest):
+    try:
+        # Request ids are the operation's index so results line up with the payload
+        items = [(str(i), _bulk_request(operation)) for i, operation in enumerate(request.operations)]
+        
+        succeeded, failed = await asyncio.to_thread(
+            execute_batched, lambda: get_service(request.access_token), items, upstream="google_tasks"
+        )
+        
+        results = []
+        for i, operation in enumerate(request.operations):
+            key = str(i)
+            result = {"index": i, "op": operation.op, "task_id": operation.task_id}
+            if key in succeeded:
+                result["status"] = "success"
+                if succeeded[key]:
+                    result["task"] = succeeded[key]
+                    result["task_id"] = succeeded[key].get('id')
+            elif operation.op == 'delete' and error_status(failed[key]) in (404, 410):
+                # Already gone counts as deleted
+                result["status"] = "success"
+            else:
+                result["status"] = "error"
+                result["error"] = str(failed[key])
+                result["http_status"] = error_status(failed[key])
+            results.append(result)
+        
+        return {"results": results}
+    except HTTPException:
+        raise
+    except RefreshError:
+        raise HTTPException(status_code=401, detail="Google token expired")
+    except UpstreamError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        print(f"Error running bulk task operations: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
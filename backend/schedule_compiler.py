@@ -0,0 +1,141 @@
+import hashlib
+import json
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+# Index matches the app's day_of_week (0=Domingo ... 6=Sábado)
+DAY_CODES = ["SU", "MO", "TU", "WE", "TH", "FR", "SA"]
+
+DEFAULT_START_TIME = "09:00"
+DEFAULT_END_TIME = "10:00"
+
+
+def _parse_hhmm(value: str) -> time:
+    hours, minutes = value.split(":")[:2]
+    return time(int(hours), int(minutes))
+
+
+def _sunday_based_weekday(d: date) -> int:
+    # date.weekday() is Monday=0; the app counts from Sunday
+    return (d.weekday() + 1) % 7
+
+
+def slot_key(title: str, start_time: str, end_time: str) -> str:
+    # Short ASCII key so it can be used as a batch Content-ID
+    raw = f"{title}|{start_time}|{end_time}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def fingerprint(body: Dict[str, Any]) -> str:
+    return hashlib.sha1(json.dumps(body, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def normalize_activity(activity: Dict[str, Any]) -> Tuple[str, str, str]:
+    """Return (title, start_time, end_time) using the same defaults as the chat tools."""
+    title = (activity.get("title") or "Atividade sem título").strip()
+    start_time = activity.get("start_time") or DEFAULT_START_TIME
+    end_time = activity.get("end_time")
+    if not end_time:
+        start = _parse_hhmm(start_time)
+        end_time = f"{(start.hour + 1) % 24:02d}:{start.minute:02d}"
+    return title, start_time, end_time
+
+
+def compile_schedule(
+    activities: List[Dict[str, Any]],
+    start_date: date,
+    end_date: Optional[date],
+    time_zone: str,
+) -> Dict[str, Dict[str, Any]]:
+    """Merge weekly activities into one recurring event per (title, time slot).
+
+    Returns ``{key: {"body": event_body, "days": [...], "activityIds": [...], ...}}``
+    where ``event_body`` carries an ``RRULE:FREQ=WEEKLY;BYDAY=...`` recurrence.
+    """
+    tz = ZoneInfo(time_zone)
+    groups: Dict[str, Dict[str, Any]] = {}
+
+    for activity in activities:
+        title, start_time, end_time = normalize_activity(activity)
+        key = slot_key(title, start_time, end_time)
+        group = groups.setdefault(key, {
+            "title": title,
+            "description": "",
+            "start_time": start_time,
+            "end_time": end_time,
+            "days": set(),
+            "activityIds": [],
+        })
+        group["days"].add(int(activity.get("day_of_week", 0)) % 7)
+        if not group["description"] and activity.get("description"):
+            group["description"] = activity["description"]
+        if activity.get("id"):
+            group["activityIds"].append(activity["id"])
+
+    until = None
+    if end_date:
+        # UNTIL must be UTC when DTSTART carries a time zone
+        local_end = datetime.combine(end_date, time(23, 59, 59), tzinfo=tz)
+        until = local_end.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+    compiled: Dict[str, Dict[str, Any]] = {}
+    start_weekday = _sunday_based_weekday(start_date)
+
+    for key, group in groups.items():
+        days = sorted(group["days"])
+        first_date = min(start_date + timedelta(days=(d - start_weekday) % 7) for d in days)
+        if end_date and first_date > end_date:
+            continue
+
+        start = _parse_hhmm(group["start_time"])
+        end = _parse_hhmm(group["end_time"])
+        start_dt = datetime.combine(first_date, start)
+        end_dt = datetime.combine(first_date, end)
+        if end_dt <= start_dt:
+            # Activity crosses midnight
+            end_dt += timedelta(days=1)
+
+        rrule = f"RRULE:FREQ=WEEKLY;BYDAY={','.join(DAY_CODES[d] for d in days)}"
+        if until:
+            rrule += f";UNTIL={until}"
+
+        body = {
+            "summary": group["title"],
+            "description": group["description"],
+            "start": {"dateTime": start_dt.isoformat(), "timeZone": time_zone},
+            "end": {"dateTime": end_dt.isoformat(), "timeZone": time_zone},
+            "recurrence": [rrule],
+        }
+        compiled[key] = {
+            "body": body,
+            "title": group["title"],
+            "start_time": group["start_time"],
+            "end_time": group["end_time"],
+            "days": days,
+            "activityIds": group["activityIds"],
+        }
+
+    return compiled
+
+
+def diff_events(
+    compiled: Dict[str, Dict[str, Any]],
+    previous: Dict[str, Dict[str, Any]],
+) -> Tuple[List[str], List[str], List[str], List[str]]:
+    """Compare compiled events against previously pushed ones.
+
+    ``previous`` maps key to ``{"eventId": ..., "hash": ...}``. Returns the keys
+    to create, patch and delete, plus the keys that are unchanged.
+    """
+    to_create, to_patch, unchanged = [], [], []
+    for key, entry in compiled.items():
+        pushed = previous.get(key)
+        if not pushed or not pushed.get("eventId"):
+            to_create.append(key)
+        elif pushed.get("hash") != fingerprint(entry["body"]):
+            to_patch.append(key)
+        else:
+            unchanged.append(key)
+    to_delete = [key for key, pushed in previous.items() if key not in compiled and pushed.get("eventId")]
+    return to_create, to_patch, to_delete, unchanged
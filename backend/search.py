@@ -0,0 +1,351 @@
+"""Full-text search over the user's notes, kanban cards and schedules.
+
+Each user gets an in-memory inverted index, built from Firestore on their
+first query and then kept current by ``index_document``/``remove_document``,
+which the data router calls on every write. Notes and kanban cards live in
+one blob document per collection, so entries are per item and only items
+whose text changed are re-tokenized. Indexes are per instance; one older
+than INDEX_TTL is rebuilt so writes served by other instances show up.
+
+Ranking is BM25 with titles counted twice. Tokens are lowercased, reduced
+to a light singular form while their accents still tell "país" (singular)
+from "pais", then stripped of accents and Portuguese stopwords. Every query
+term also matches as a prefix of longer terms (at a discount), so "estud"
+finds "estudo" and "estudar".
+"""
+import functools
+import hashlib
+import heapq
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from backend.resilience import guarded
+
+SEARCH_COLLECTIONS = ("notes", "kanban-tasks", "schedules")
+
+MAX_INDEXED_USERS = 256
+INDEX_TTL = float(os.getenv("SEARCH_INDEX_TTL_SECONDS", "300"))
+
+# BM25
+K1 = 1.2
+B = 0.75
+TITLE_WEIGHT = 2
+PREFIX_WEIGHT = 0.6
+MAX_PREFIX_EXPANSIONS = 50
+MIN_PREFIX_LENGTH = 2
+SNIPPET_CHARS = 160
+
+KANBAN_COLUMNS = {"todo": "A Fazer", "in-progress": "Em Progresso", "done": "Concluído"}
+
+STOPWORDS = frozenset("""
+a ao aos as com como da das de dela dele deles do dos e ela elas ele eles em
+entre era essa esse esta este eu isso isto ja la lhe mais mas me mesmo meu
+minha muito na nas nem no nos nossa nosso num numa o os ou para pela pelas
+pelo pelos por qual quando que quem se sem ser seu sua so sao tambem te tem
+ter um uma umas uns voce voces
+""".split())
+
+_TOKEN = re.compile(r"[^\W_]+")
+
+# Plural endings, longest first, after RSLP's plural step: "lições" -> "lição",
+# "animais" -> "animal", "papéis" -> "papel", "gases" -> "gas"
+_PLURALS = (
+    ("ões", "ão"), ("ães", "ão"), ("ais", "al"), ("éis", "el"), ("eis", "el"), ("óis", "ol"),
+    ("ns", "m"), ("res", "r"), ("ses", "s"), ("zes", "z"), ("s", ""),
+)
+# A stressed last syllable means a singular: "país", "inglês", "mês", "gás", "após"
+_STRESSED_FINAL_S = re.compile(r"[áéíóúâêô]s$")
+# Singulars ending in an unstressed -s (RSLP's exception list, trimmed to common words)
+_SINGULAR_S = frozenset("""
+lapis pires cais menos ferias fezes pesames atlas onibus virus tenis bonus status campus oculos simples
+""".split())
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip accents: "Revisão" -> "revisao"."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def _singular(word: str) -> str:
+    """Light plural reduction of a lowercased, still accented word."""
+    if len(word) <= 3 or word.isdigit() or _STRESSED_FINAL_S.search(word) or fold(word) in _SINGULAR_S:
+        return word
+    for suffix, replacement in _PLURALS:
+        # Short stems are left alone ("pais" isn't "pal", "leis" isn't "lel"), except for -ão ("pães")
+        if word.endswith(suffix) and len(word) - len(suffix) >= (1 if replacement == "ão" else 2):
+            stem = word[: -len(suffix)] + replacement
+            if len(stem) >= 3:
+                word = stem
+                break
+    # "-ses" is the plural of both "gás" and "classe"; drop the final e so each pair meets
+    if word.endswith("se") and len(word) > 3:
+        word = word[:-1]
+    return word
+
+
+@functools.lru_cache(maxsize=65536)
+def _term(word: str) -> str:
+    """Index term for a lowercased word, or "" for a stopword."""
+    if fold(word) in STOPWORDS:
+        return ""
+    return fold(_singular(word))
+
+
+def tokenize(text: str) -> List[str]:
+    # NFC keeps accents attached to their letters, so words aren't split at them
+    words = _TOKEN.findall(unicodedata.normalize("NFC", text.lower()))
+    return [term for term in map(_term, words) if term]
+
+
+class _Entry:
+    __slots__ = ("collection", "source_id", "item_id", "title", "text", "tf", "length", "digest")
+
+    def __init__(self, collection, source_id, item_id, title, text, digest):
+        self.collection = collection
+        self.source_id = source_id
+        self.item_id = item_id
+        self.title = title
+        self.text = text
+        self.digest = digest
+        tf: Dict[str, int] = {}
+        for token in tokenize(title):
+            tf[token] = tf.get(token, 0) + TITLE_WEIGHT
+        for token in tokenize(text):
+            tf[token] = tf.get(token, 0) + 1
+        self.tf = tf
+        self.length = sum(tf.values())
+
+
+def extract(collection: str, doc_id: str, data: Dict[str, Any]) -> List[Tuple[str, str, str]]:
+    """(item_id, title, text) of every searchable item in a stored document."""
+    if collection == "notes":
+        return [
+            (str(note.get("id") or i), note.get("title") or "", note.get("content") or "")
+            for i, note in enumerate(data.get("notes") or [])
+        ]
+    if collection == "kanban-tasks":
+        return [
+            (str(card.get("id") or i), card.get("title") or "", KANBAN_COLUMNS.get(card.get("column"), ""))
+            for i, card in enumerate(data.get("tasks") or [])
+        ]
+    if collection == "schedules":
+        # One document per schedule; older clients kept them all in a list
+        if isinstance(data.get("schedules"), list):
+            schedules = [(str(s.get("id") or i), s) for i, s in enumerate(data["schedules"])]
+        else:
+            schedules = [(doc_id, data)]
+        items = []
+        for item_id, schedule in schedules:
+            lines = [
+                " ".join(filter(None, [activity.get("title"), activity.get("description")]))
+                for activity in schedule.get("activities") or []
+            ]
+            items.append((item_id, schedule.get("title") or "", "\n".join(filter(None, lines))))
+        return items
+    return []
+
+
+class SearchIndex:
+    def __init__(self):
+        self.entries: Dict[str, _Entry] = {}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.sources: Dict[Tuple[str, str], Set[str]] = {}
+        self.total_length = 0
+        self.vocabulary: Optional[List[str]] = None
+        self.built_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _add(self, key: str, entry: _Entry) -> None:
+        self.entries[key] = entry
+        self.total_length += entry.length
+        for term, tf in entry.tf.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = {}
+                self.vocabulary = None
+            postings[key] = tf
+
+    def _remove(self, key: str) -> None:
+        entry = self.entries.pop(key)
+        self.total_length -= entry.length
+        for term in entry.tf:
+            postings = self.postings[term]
+            del postings[key]
+            if not postings:
+                del self.postings[term]
+                self.vocabulary = None
+
+    def replace_source(self, collection: str, source_id: str, items: Iterable[Tuple[str, str, str]]) -> None:
+        """Make the entries of one stored document match ``items``."""
+        with self.lock:
+            old_keys = self.sources.pop((collection, source_id), set())
+            new_keys = set()
+            for item_id, title, text in items:
+                key = f"{collection}/{source_id}/{item_id}"
+                digest = hashlib.sha1(f"{title}\x00{text}".encode()).hexdigest()
+                new_keys.add(key)
+                current = self.entries.get(key)
+                if current is not None and current.digest == digest:
+                    continue
+                if current is not None:
+                    self._remove(key)
+                self._add(key, _Entry(collection, source_id, item_id, title, text, digest))
+            for key in old_keys - new_keys:
+                self._remove(key)
+            if new_keys:
+                self.sources[(collection, source_id)] = new_keys
+
+    def _expand(self, term: str) -> List[Tuple[str, float]]:
+        expansions = [(term, 1.0)] if term in self.postings else []
+        if len(term) < MIN_PREFIX_LENGTH:
+            return expansions
+        if self.vocabulary is None:
+            self.vocabulary = sorted(self.postings)
+        i = bisect_left(self.vocabulary, term)
+        while i < len(self.vocabulary) and len(expansions) <= MAX_PREFIX_EXPANSIONS:
+            candidate = self.vocabulary[i]
+            if not candidate.startswith(term):
+                break
+            if candidate != term:
+                expansions.append((candidate, PREFIX_WEIGHT))
+            i += 1
+        return expansions
+
+    def search(self, query: str, limit: int = 10, collections: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        terms = list(dict.fromkeys(tokenize(query)))
+        allowed = set(collections) if collections else None
+        with self.lock:
+            if not terms or not self.entries:
+                return []
+            n = len(self.entries)
+            avgdl = self.total_length / n
+            scores: Dict[str, float] = {}
+            for term in terms:
+                # A query term scores once per entry, through its best matching index term
+                best: Dict[str, float] = {}
+                for index_term, weight in self._expand(term):
+                    postings = self.postings[index_term]
+                    idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for key, tf in postings.items():
+                        length = self.entries[key].length
+                        score = weight * idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avgdl))
+                        if score > best.get(key, 0.0):
+                            best[key] = score
+                for key, score in best.items():
+                    scores[key] = scores.get(key, 0.0) + score
+            if allowed is not None:
+                scores = {k: s for k, s in scores.items() if self.entries[k].collection in allowed}
+            top = heapq.nlargest(limit, scores.items(), key=lambda kv: kv[1])
+            return [self._result(self.entries[key], score, terms) for key, score in top]
+
+    def _result(self, entry: _Entry, score: float, terms: List[str]) -> Dict[str, Any]:
+        return {
+            "collection": entry.collection,
+            "docId": entry.source_id,
+            "id": entry.item_id,
+            "title": entry.title,
+            "snippet": snippet(entry.text, terms),
+            "score": round(score, 4),
+        }
+
+
+def snippet(text: str, terms: List[str], size: int = SNIPPET_CHARS) -> str:
+    if len(text) <= size:
+        return text
+    # Fold char by char so positions in the folded text match the original
+    folded = "".join((fold(c) or " ")[0] for c in text)
+    # Stemmed terms may be longer than the word's stem ("licao" for "lições"), so match on a shorter head
+    positions = [p for p in (folded.find(t[: max(3, len(t) - 2)]) for t in terms) if p >= 0]
+    start = max(0, min(positions) - size // 4) if positions else 0
+    excerpt = text[start:start + size].strip()
+    return ("…" if start else "") + excerpt + ("…" if start + size < len(text) else "")
+
+
+_indexes: "OrderedDict[str, SearchIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+_build_locks: Dict[str, threading.Lock] = {}
+# uid -> writes seen while that user's index is being built, replayed before it's cached
+_pending_writes: Dict[str, List[Tuple[str, str, Optional[Dict[str, Any]]]]] = {}
+
+
+def _cached(uid: str) -> Optional[SearchIndex]:
+    with _indexes_lock:
+        index = _indexes.get(uid)
+        if index is not None:
+            _indexes.move_to_end(uid)
+        return index
+
+
+def build_index(db, uid: str) -> SearchIndex:
+    index = SearchIndex()
+    for collection in SEARCH_COLLECTIONS:
+        query = db.collection("users").document(uid).collection(collection)
+        docs = guarded("firestore", "stream", lambda: list(query.stream()), idempotent=True, hedge=True)
+        for doc in docs:
+            index.replace_source(collection, doc.id, extract(collection, doc.id, doc.to_dict() or {}))
+    return index
+
+
+def get_index(uid: str, db_factory: Callable[[], Any]) -> SearchIndex:
+    index = _cached(uid)
+    if index is not None and time.monotonic() - index.built_at < INDEX_TTL:
+        return index
+
+    with _indexes_lock:
+        build_lock = _build_locks.setdefault(uid, threading.Lock())
+    # One build per user at a time; concurrent queries wait for it
+    with build_lock:
+        index = _cached(uid)
+        if index is not None and time.monotonic() - index.built_at < INDEX_TTL:
+            return index
+        with _indexes_lock:
+            _pending_writes[uid] = []
+        try:
+            index = build_index(db_factory(), uid)
+        except BaseException:
+            with _indexes_lock:
+                _pending_writes.pop(uid, None)
+            raise
+        with _indexes_lock:
+            # The build may have read a collection before these writes landed
+            for collection, doc_id, data in _pending_writes.pop(uid):
+                index.replace_source(collection, doc_id, extract(collection, doc_id, data) if data is not None else [])
+            _indexes[uid] = index
+            _indexes.move_to_end(uid)
+            while len(_indexes) > MAX_INDEXED_USERS:
+                evicted, _ = _indexes.popitem(last=False)
+                _build_locks.pop(evicted, None)
+    return index
+
+
+def search(uid: str, query: str, db_factory: Callable[[], Any], limit: int = 10, collections: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+    return get_index(uid, db_factory).search(query, limit, collections)
+
+
+def _apply_write(uid: str, collection: str, doc_id: str, data: Optional[Dict[str, Any]]) -> None:
+    with _indexes_lock:
+        pending = _pending_writes.get(uid)
+        if pending is not None:
+            pending.append((collection, doc_id, data))
+        index = _indexes.get(uid)
+    if index is not None:
+        index.replace_source(collection, doc_id, extract(collection, doc_id, data) if data is not None else [])
+
+
+def index_document(uid: str, collection: str, doc_id: str, data: Dict[str, Any]) -> None:
+    """Apply a write to the user's index, if this instance has one loaded or building."""
+    if collection in SEARCH_COLLECTIONS:
+        _apply_write(uid, collection, doc_id, data)
+
+
+def remove_document(uid: str, collection: str, doc_id: str) -> None:
+    if collection in SEARCH_COLLECTIONS:
+        _apply_write(uid, collection, doc_id, None)
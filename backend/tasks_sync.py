@@ -0,0 +1,346 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.google_batch import execute_batched, error_status
+from backend.metrics import track_upstream
+
+# Firestore collection holding the user's goals ("Metas")
+GOALS_COLLECTION = "tasks"
+TOMBSTONES_COLLECTION = "sync-tombstones"
+SYNC_MAP_COLLECTION = "tasks-sync-map"
+SYNC_STATE_DOC = ("sync", "google-tasks")
+
+# Cursors are moved back by this much so writes racing the sync are seen again;
+# replays are filtered out by the versions kept in the mapping table.
+CURSOR_SKEW = timedelta(seconds=60)
+
+# Firestore limits
+MAX_WRITES_PER_BATCH = 500
+MAX_IN_FILTER = 30
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def parse_ts(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _chunks(items: List[Any], size: int) -> List[List[Any]]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def record_tombstone(db, uid: str, doc_id: str) -> None:
+    """Remember a deleted goal so the next sync can delete its Google task."""
+    db.collection("users").document(uid).collection(TOMBSTONES_COLLECTION).document(doc_id).set({
+        "docId": doc_id,
+        "deleted_at": now_iso(),
+    })
+
+
+def goal_to_task(goal: Dict[str, Any]) -> Dict[str, Any]:
+    body = {"title": goal.get("title") or ""}
+    if goal.get("completed"):
+        body["status"] = "completed"
+    else:
+        body["status"] = "needsAction"
+        body["completed"] = None
+    return body
+
+
+def task_to_goal(task: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "title": task.get("title") or "",
+        "completed": task.get("status") == "completed",
+    }
+
+
+def resolve(goal_change: Optional[Dict[str, Any]], task_change: Optional[Dict[str, Any]]) -> str:
+    """Pick the winning side when both sides of a pair changed since the last sync.
+
+    Rules, applied in order so every replica reaches the same answer:
+    a deletion beats an edit, then the later timestamp wins, and on a tie
+    Firestore wins.
+    """
+    if goal_change is None:
+        return "tasks"
+    if task_change is None:
+        return "firestore"
+    goal_deleted = goal_change.get("deleted", False)
+    task_deleted = bool(task_change.get("deleted"))
+    if goal_deleted != task_deleted:
+        return "firestore" if goal_deleted else "tasks"
+    goal_ts = parse_ts(goal_change.get("updated_at"))
+    task_ts = parse_ts(task_change.get("updated"))
+    if goal_ts and task_ts and task_ts > goal_ts:
+        return "tasks"
+    return "firestore"
+
+
+class TasksSync:
+    """Incremental reconciliation between Firestore goals and one Google Tasks list.
+
+    State per user:
+      users/{uid}/sync/google-tasks      cursors for both sides, goals whose push failed
+      users/{uid}/tasks-sync-map/{goal}  goal id <-> task id plus the last synced versions
+      users/{uid}/sync-tombstones/{goal} goals deleted through /api/data
+
+    Only items changed since the cursors are read, and the mapping table is
+    looked up by key, so a run costs O(changes) rather than O(items).
+    """
+
+    def __init__(self, db, uid: str, tasklist: str, service_factory):
+        self.db = db
+        self.uid = uid
+        self.tasklist = tasklist
+        self.service_factory = service_factory
+        self.user_ref = db.collection("users").document(uid)
+        self.state_ref = self.user_ref.collection(SYNC_STATE_DOC[0]).document(SYNC_STATE_DOC[1])
+        self.map_ref = self.user_ref.collection(SYNC_MAP_COLLECTION)
+        self.goals_ref = self.user_ref.collection(GOALS_COLLECTION)
+
+    # Pull
+
+    def _changed_goals(self, cursor: Optional[str], retry_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        query = self.goals_ref
+        tombstones = self.user_ref.collection(TOMBSTONES_COLLECTION)
+        if cursor:
+            query = query.where("updated_at", ">", cursor)
+            tombstones = tombstones.where("deleted_at", ">", cursor)
+        changes = {}
+        with track_upstream("firestore", "stream"):
+            for doc in query.stream():
+                goal = doc.to_dict()
+                goal["id"] = doc.id
+                changes[doc.id] = goal
+            for doc in tombstones.stream():
+                if doc.id not in changes:
+                    changes[doc.id] = {"id": doc.id, "deleted": True, "updated_at": doc.to_dict().get("deleted_at")}
+
+        # Goals whose push failed last time are behind the cursor now; read them by key
+        retry_ids = [goal_id for goal_id in retry_ids if goal_id not in changes]
+        if retry_ids:
+            with track_upstream("firestore", "get_all"):
+                goals = list(self.db.get_all([self.goals_ref.document(goal_id) for goal_id in retry_ids]))
+                deleted = [snapshot.id for snapshot in goals if not snapshot.exists]
+                tombstoned = list(self.db.get_all([tombstones.document(goal_id) for goal_id in deleted])) if deleted else []
+            for snapshot in goals:
+                if snapshot.exists:
+                    changes[snapshot.id] = {**snapshot.to_dict(), "id": snapshot.id}
+            for snapshot in tombstoned:
+                if snapshot.exists:
+                    changes[snapshot.id] = {"id": snapshot.id, "deleted": True, "updated_at": snapshot.to_dict().get("deleted_at")}
+        return changes
+
+    def _changed_tasks(self, service, cursor: Optional[str]) -> Dict[str, Dict[str, Any]]:
+        changes = {}
+        page_token = None
+        while True:
+            params = {
+                "tasklist": self.tasklist,
+                "showCompleted": True,
+                "showHidden": True,
+                "maxResults": 100,
+            }
+            if cursor:
+                params["updatedMin"] = cursor
+                params["showDeleted"] = True
+            if page_token:
+                params["pageToken"] = page_token
+            with track_upstream("google_tasks", "tasks.list"):
+                results = service.tasks().list(**params).execute()
+            for task in results.get("items", []):
+                changes[task["id"]] = task
+            page_token = results.get("nextPageToken")
+            if not page_token:
+                return changes
+
+    def _load_mappings(self, goal_ids: List[str], task_ids: List[str]) -> Tuple[Dict[str, Dict], Dict[str, Dict]]:
+        by_goal: Dict[str, Dict[str, Any]] = {}
+        by_task: Dict[str, Dict[str, Any]] = {}
+        if goal_ids:
+            with track_upstream("firestore", "get_all"):
+                snapshots = list(self.db.get_all([self.map_ref.document(goal_id) for goal_id in goal_ids]))
+            for snapshot in snapshots:
+                if snapshot.exists:
+                    entry = snapshot.to_dict()
+                    by_goal[snapshot.id] = entry
+                    by_task[entry["taskId"]] = entry
+        remaining = [task_id for task_id in task_ids if task_id not in by_task]
+        for chunk in _chunks(remaining, MAX_IN_FILTER):
+            with track_upstream("firestore", "stream"):
+                docs = list(self.map_ref.where("taskId", "in", chunk).stream())
+            for doc in docs:
+                entry = doc.to_dict()
+                by_goal[doc.id] = entry
+                by_task[entry["taskId"]] = entry
+        return by_goal, by_task
+
+    def _link_by_title(self, goal_changes, task_changes, by_goal, by_task) -> None:
+        # First sync: goals and tasks created before syncing existed are paired by
+        # title instead of being duplicated on both sides
+        unmapped_tasks: Dict[str, List[str]] = {}
+        for task_id, task in task_changes.items():
+            if task_id not in by_task and not task.get("deleted"):
+                unmapped_tasks.setdefault((task.get("title") or "").strip().lower(), []).append(task_id)
+        for goal_id, goal in goal_changes.items():
+            if goal_id in by_goal or goal.get("deleted"):
+                continue
+            candidates = unmapped_tasks.get((goal.get("title") or "").strip().lower())
+            if candidates:
+                entry = {"goalId": goal_id, "taskId": candidates.pop(0)}
+                by_goal[goal_id] = entry
+                by_task[entry["taskId"]] = entry
+
+    # Run
+
+    def run(self) -> Dict[str, Any]:
+        started = datetime.now(timezone.utc)
+        with track_upstream("firestore", "get"):
+            state_snapshot = self.state_ref.get()
+        state = state_snapshot.to_dict() if state_snapshot.exists else {}
+        if state.get("tasklist") not in (None, self.tasklist):
+            # Cursors belong to another list; start over
+            state = {}
+
+        service = self.service_factory()
+        goal_changes = self._changed_goals(state.get("firestoreCursor"), state.get("retryGoals") or [])
+        task_changes = self._changed_tasks(service, state.get("tasksCursor"))
+        by_goal, by_task = self._load_mappings(list(goal_changes), list(task_changes))
+
+        # Drop our own echoes: versions we wrote on the previous run
+        for goal_id in list(goal_changes):
+            entry = by_goal.get(goal_id)
+            if entry and not goal_changes[goal_id].get("deleted") and entry.get("goalVersion") == goal_changes[goal_id].get("updated_at"):
+                del goal_changes[goal_id]
+        for task_id in list(task_changes):
+            entry = by_task.get(task_id)
+            if entry and not task_changes[task_id].get("deleted") and entry.get("taskVersion") == task_changes[task_id].get("updated"):
+                del task_changes[task_id]
+            elif not entry and task_changes[task_id].get("deleted"):
+                # Deleted before we ever saw it
+                del task_changes[task_id]
+
+        if not state:
+            self._link_by_title(goal_changes, task_changes, by_goal, by_task)
+
+        push: List[Tuple[str, str, Dict[str, Any]]] = [] # (op, goal_id, goal)
+        pull: List[Tuple[str, str, Dict[str, Any]]] = [] # (op, task_id, task)
+        conflicts = []
+        writes: List[Tuple[str, Any, Optional[Dict[str, Any]]]] = [] # (kind, ref, data)
+
+        for goal_id, goal in goal_changes.items():
+            entry = by_goal.get(goal_id)
+            task = task_changes.pop(entry["taskId"], None) if entry else None
+            winner = resolve(goal, task)
+            if task is not None:
+                conflicts.append({"goalId": goal_id, "taskId": entry["taskId"], "winner": winner})
+            if winner == "tasks":
+                pull.append(("delete" if task.get("deleted") else "update", task["id"], task))
+            elif goal.get("deleted"):
+                if entry:
+                    push.append(("delete", goal_id, goal))
+            else:
+                push.append(("update" if entry else "create", goal_id, goal))
+            if goal.get("deleted") and (winner == "tasks" or not entry):
+                # Nothing to delete on the Google side: never synced, or the task is gone too
+                writes.append(("delete", self.user_ref.collection(TOMBSTONES_COLLECTION).document(goal_id), None))
+
+        for task_id, task in task_changes.items():
+            entry = by_task.get(task_id)
+            if task.get("deleted"):
+                pull.append(("delete", task_id, task))
+            else:
+                pull.append(("update" if entry else "create", task_id, task))
+
+        result = {"pushed": {"create": 0, "update": 0, "delete": 0}, "pulled": {"create": 0, "update": 0, "delete": 0}, "conflicts": conflicts, "errors": []}
+        retry_goals = []
+
+        # Push Firestore -> Google Tasks through the batch engine
+        items = []
+        for op, goal_id, goal in push:
+            if op == "create":
+                body = goal_to_task(goal)
+                items.append((goal_id, lambda s, body=body: s.tasks().insert(tasklist=self.tasklist, body=body)))
+            elif op == "update":
+                body, task_id = goal_to_task(goal), by_goal[goal_id]["taskId"]
+                items.append((goal_id, lambda s, body=body, task_id=task_id: s.tasks().patch(tasklist=self.tasklist, task=task_id, body=body)))
+            else:
+                task_id = by_goal[goal_id]["taskId"]
+                items.append((goal_id, lambda s, task_id=task_id: s.tasks().delete(tasklist=self.tasklist, task=task_id)))
+        succeeded, failed = execute_batched(self.service_factory, items, upstream="google_tasks")
+
+        for op, goal_id, goal in push:
+            error = failed.get(goal_id)
+            gone = error is not None and error_status(error) in (404, 410)
+            if error is not None and not (op == "delete" and gone):
+                result["errors"].append({"goalId": goal_id, "op": op, "error": str(error)})
+                # The cursor moves past this goal; remember it so the next run pushes it again
+                retry_goals.append(goal_id)
+                if op == "update" and gone:
+                    # The task was removed behind our back; unlink so the next run recreates it
+                    writes.append(("delete", self.map_ref.document(goal_id), None))
+                continue
+            result["pushed"][op] += 1
+            if op == "delete":
+                writes.append(("delete", self.map_ref.document(goal_id), None))
+                writes.append(("delete", self.user_ref.collection(TOMBSTONES_COLLECTION).document(goal_id), None))
+                continue
+            task = succeeded[goal_id]
+            writes.append(("set", self.map_ref.document(goal_id), {
+                "goalId": goal_id,
+                "taskId": task["id"],
+                "goalVersion": goal.get("updated_at"),
+                "taskVersion": task.get("updated"),
+            }))
+
+        # Pull Google Tasks -> Firestore
+        for op, task_id, task in pull:
+            entry = by_task.get(task_id)
+            if op == "delete":
+                if entry:
+                    writes.append(("delete", self.goals_ref.document(entry["goalId"]), None))
+                    writes.append(("delete", self.map_ref.document(entry["goalId"]), None))
+                    result["pulled"]["delete"] += 1
+                continue
+            version = now_iso()
+            goal_ref = self.goals_ref.document(entry["goalId"]) if entry else self.goals_ref.document()
+            data = {**task_to_goal(task), "id": goal_ref.id, "updated_at": version}
+            if entry:
+                writes.append(("merge", goal_ref, data))
+            else:
+                data["created_at"] = version
+                writes.append(("set", goal_ref, data))
+            writes.append(("set", self.map_ref.document(goal_ref.id), {
+                "goalId": goal_ref.id,
+                "taskId": task_id,
+                "goalVersion": version,
+                "taskVersion": task.get("updated"),
+            }))
+            result["pulled"][op] += 1
+
+        cursor = (started - CURSOR_SKEW).isoformat()
+        writes.append(("set", self.state_ref, {
+            "tasklist": self.tasklist,
+            "firestoreCursor": cursor,
+            "tasksCursor": (started - CURSOR_SKEW).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+            "lastSync": started.isoformat(),
+            "retryGoals": retry_goals,
+        }))
+
+        for chunk in _chunks(writes, MAX_WRITES_PER_BATCH):
+            batch = self.db.batch()
+            for kind, ref, data in chunk:
+                if kind == "delete":
+                    batch.delete(ref)
+                elif kind == "merge":
+                    batch.set(ref, data, merge=True)
+                else:
+                    batch.set(ref, data)
+            with track_upstream("firestore", "batch.commit"):
+                batch.commit()
+
+        return result
@@ -0,0 +1,220 @@
+"""Per-request spans, Server-Timing header and an opt-in sampling profiler.
+
+Spans are collected in a context variable, so they follow the request into
+FastAPI's threadpool. The profiler is off unless PROFILE_SLOW_MS is set; it
+then samples the stacks of the threads serving a request (those inside one
+of its spans, plus the event loop for ``async`` handlers) and logs the
+folded stacks of requests slower than the threshold.
+"""
+import inspect
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+
+def _env_float(name: str, default: Optional[float]) -> Optional[float]:
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        print(f"[Python] Ignoring invalid {name}={value!r}")
+        return default
+
+
+PROFILE_SLOW_MS = _env_float("PROFILE_SLOW_MS", None)
+PROFILE_SAMPLE_RATE = _env_float("PROFILE_SAMPLE_RATE", 1.0)
+PROFILE_INTERVAL_SECONDS = _env_float("PROFILE_INTERVAL_MS", 5.0) / 1000
+PROFILE_TOP_STACKS = 20
+MAX_STACK_DEPTH = 64
+
+
+class RequestTrace:
+    __slots__ = ("spans", "threads", "samples", "scope", "loop_thread")
+
+    def __init__(self, scope=None):
+        self.spans: List[Tuple[str, float]] = []
+        # thread id -> spans of this request open on it; a thread leaves when its last span closes
+        self.threads: Dict[int, int] = {}
+        self.samples: Optional[StackCounter] = None
+        self.scope = scope
+        self.loop_thread = threading.get_ident()
+
+    def _enter(self, thread_id: int) -> None:
+        self.threads[thread_id] = self.threads.get(thread_id, 0) + 1
+
+    def _exit(self, thread_id: int) -> None:
+        depth = self.threads.get(thread_id, 0) - 1
+        if depth > 0:
+            self.threads[thread_id] = depth
+        else:
+            self.threads.pop(thread_id, None)
+
+    def sampled_threads(self) -> List[int]:
+        threads = list(self.threads)
+        # The event loop runs every async request at once; only attribute it to async handlers
+        endpoint = (self.scope or {}).get("endpoint")
+        if endpoint is not None and inspect.iscoroutinefunction(endpoint) and self.loop_thread not in threads:
+            threads.append(self.loop_thread)
+        return threads
+
+
+_current: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time a step of the current request; a no-op outside of a request."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    thread_id = threading.get_ident()
+    trace._enter(thread_id)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.spans.append((name, time.perf_counter() - started))
+        trace._exit(thread_id)
+
+
+def server_timing(spans: List[Tuple[str, float]], total: float) -> str:
+    totals: Dict[str, List[float]] = {}
+    for name, duration in spans:
+        entry = totals.setdefault(name, [0.0, 0])
+        entry[0] += duration
+        entry[1] += 1
+    parts = []
+    for name, (duration, count) in totals.items():
+        part = f"{name};dur={duration * 1000:.1f}"
+        if count > 1:
+            part += f';desc="x{count}"'
+        parts.append(part)
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class _Sampler:
+    """One daemon thread sampling every request currently being profiled."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.active: Dict[int, RequestTrace] = {}
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self, trace: RequestTrace) -> None:
+        trace.samples = StackCounter()
+        with self.lock:
+            self.active[id(trace)] = trace
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self.thread.start()
+
+    def stop(self, trace: RequestTrace) -> None:
+        with self.lock:
+            self.active.pop(id(trace), None)
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                traces = list(self.active.values())
+            if not traces:
+                continue
+            frames = sys._current_frames()
+            for trace in traces:
+                for thread_id in trace.sampled_threads():
+                    frame = frames.get(thread_id)
+                    if frame is not None and thread_id != own:
+                        trace.samples[_fold(frame)] += 1
+
+
+def _fold(frame) -> str:
+    stack = []
+    while frame is not None and len(stack) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+_sampler = _Sampler(PROFILE_INTERVAL_SECONDS)
+
+
+class TimingMiddleware:
+    """Adds a Server-Timing header and logs one JSON line per request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace(scope)
+        token = _current.set(trace)
+        profiling = PROFILE_SLOW_MS is not None and random.random() < PROFILE_SAMPLE_RATE
+        if profiling:
+            _sampler.start(trace)
+
+        started = time.perf_counter()
+        status_holder = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(trace.spans, time.perf_counter() - started).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            if profiling:
+                _sampler.stop(trace)
+            duration_ms = (time.perf_counter() - started) * 1000
+            # Imported here: metrics imports this module
+            from backend.metrics import route_label
+            route = route_label(scope)
+            spans: Dict[str, float] = {}
+            for name, duration in trace.spans:
+                spans[name] = round(spans.get(name, 0.0) + duration * 1000, 1)
+            log = {
+                "event": "request",
+                "method": scope["method"],
+                "route": route,
+                "status": status_holder["status"],
+                "duration_ms": round(duration_ms, 1),
+                "spans": spans,
+            }
+            print(json.dumps(log))
+            if profiling and duration_ms >= PROFILE_SLOW_MS and trace.samples:
+                print(json.dumps({
+                    "event": "slow_request_profile",
+                    "method": scope["method"],
+                    "route": route,
+                    "duration_ms": round(duration_ms, 1),
+                    "interval_ms": PROFILE_INTERVAL_SECONDS * 1000,
+                    "samples": sum(trace.samples.values()),
+                    # Folded stacks, ready for flamegraph.pl / speedscope
+                    "stacks": dict(trace.samples.most_common(PROFILE_TOP_STACKS)),
+                }))